@@ -1,19 +1,32 @@
-from imports import torch, os, shutil, cv2
+from imports import torch, os, shutil, np
 from datetime import datetime
+import threading
 from PIL import Image
-from sklearn.metrics.pairwise import cosine_similarity
 from transformers import CLIPProcessor, CLIPModel
-from AI_Models.faiss_instance import faiss_client
+from AI_Models.faiss_instance import faiss_client, BASE_DIR
+from AI_Models.model_registry import model_registry
+from AI_Models.embedding_cache import TextEmbeddingCache
+from AI_Models.result_clip import write_result_clip
+
+DEFAULT_CLIP_MODEL = "openai/clip-vit-base-patch32"
+
+# Cache des embeddings de prompts, partagé par tous les comparateurs et conservé entre les sessions
+text_embedding_cache = TextEmbeddingCache(max_entries=1024, path=os.path.join(BASE_DIR, "text_embeddings_cache.npz"))
 
 # --- Classe EmbeddingComparator ---
 class EmbeddingComparator:
-    def __init__(self, model_name="openai/clip-vit-base-patch32"):
+    def __init__(self, model_name=DEFAULT_CLIP_MODEL, cache=None):
         """
         Initialise le modèle CLIP (base par défaut) et son processor.
+        Préférer get_comparator() pour réutiliser le modèle déjà chargé dans le processus.
+        `cache` (TextEmbeddingCache) remplace le cache des prompts partagé du processus.
         """
+        self.model_name = model_name
+        self.cache = cache if cache is not None else text_embedding_cache
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model = CLIPModel.from_pretrained(model_name).to(self.device)
         self.processor = CLIPProcessor.from_pretrained(model_name, use_fast=False)
+        self.lock = threading.Lock()  # Sérialise les passes du modèle quand il est partagé entre threads
 
     def encode_image(self, image_path):
         """
@@ -24,39 +37,86 @@ class EmbeddingComparator:
             np.ndarray: Embedding de l'image.
         """
         image = Image.open(image_path).convert("RGB")
-        inputs = self.processor(images=image, return_tensors="pt", padding=True).to(self.device)
-        with torch.no_grad():
-            image_features = self.model.get_image_features(**inputs)
-        image_embedding = image_features / image_features.norm(dim=-1, keepdim=True)
-        return image_embedding.cpu().numpy()
+        return self.encode_images([image])
 
-    def encode_text(self, text):
+    def encode_images(self, frames, batch_size=16, bgr=False):
         """
-        Encode un texte en vecteur d'embedding CLIP normalisé.
-
+        Encode des images en mémoire par micro-batches (une seule passe du modèle par batch).
         Args:
-            text (str): Phrase ou mot à encoder.
+            frames (list): Images PIL ou tableaux numpy (H, W, 3).
+            batch_size (int): Nombre d'images traitées par passe.
+            bgr (bool): True si les tableaux numpy sont en BGR (sortie directe de cv2).
         Returns:
-            np.ndarray: Embedding du texte.
+            np.ndarray: Embeddings normalisés, une ligne par image.
         """
-        inputs = self.processor(text=text, return_tensors="pt", padding=True).to(self.device)
-
-        with torch.no_grad():
-            text_features = self.model.get_text_features(**inputs)
-
-        text_embedding = text_features / text_features.norm(dim=-1, keepdim=True)
-        return text_embedding.cpu().numpy()
+        embeddings = []
+        for start in range(0, len(frames), batch_size):
+            batch = [self.to_rgb(frame, bgr) for frame in frames[start:start + batch_size]]
+            inputs = self.processor(images=batch, return_tensors="pt").to(self.device)
+            with self.lock, torch.no_grad():
+                image_features = self.model.get_image_features(**inputs)
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+            embeddings.append(image_features.cpu().numpy())
+
+        if not embeddings:
+            return np.empty((0, self.model.config.projection_dim), dtype=np.float32)
+        return np.concatenate(embeddings)
+
+    @staticmethod
+    def to_rgb(frame, bgr=False):
+        """
+        Prépare une frame pour le processor CLIP.
+        Une frame numpy BGR est retournée comme vue RGB (inversion des canaux sans copie).
+        """
+        if bgr and isinstance(frame, np.ndarray):
+            return frame[..., ::-1]
+        return frame
 
-    def compare_embeddings(self, embedding1, embedding2):
+    def encode_text(self, text):
         """
-        Calcule la similarité cosinus entre deux vecteurs d'embedding.
+        Encode un texte (ou une liste de textes) en vecteurs d'embedding CLIP normalisés.
+        Les prompts déjà encodés sont lus dans le cache ; les autres sont encodés en une seule passe.
+
         Args:
-            embedding1 (np.ndarray): Premier vecteur.
-            embedding2 (np.ndarray): Deuxième vecteur.
+            text (str | list): Phrase ou mot à encoder, ou liste de phrases.
         Returns:
-            float: Score de similarité (entre -1 et 1).
+            np.ndarray: Embeddings des textes, une ligne par texte.
         """
-        return cosine_similarity(embedding1, embedding2)[0][0]
+        texts = [text] if isinstance(text, str) else list(text)
+        embeddings = [self.cache.get(self.model_name, t) for t in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if missing:
+            inputs = self.processor(text=[texts[i] for i in missing], return_tensors="pt", padding=True).to(self.device)
+
+            with self.lock, torch.no_grad():
+                text_features = self.model.get_text_features(**inputs)
+
+            text_features = (text_features / text_features.norm(dim=-1, keepdim=True)).cpu().numpy()
+            for i, embedding in zip(missing, text_features):
+                embeddings[i] = embedding
+                self.cache.put(self.model_name, texts[i], embedding)
+
+        return np.stack(embeddings).astype(np.float32)
+
+
+def get_comparator(model_name=DEFAULT_CLIP_MODEL):
+    """Retourne l'EmbeddingComparator partagé du processus (chargé une seule fois)."""
+    return model_registry.get(model_name, lambda: EmbeddingComparator(model_name))
+
+
+def warm_up_comparator(model_name=DEFAULT_CLIP_MODEL):
+    """Précharge le modèle CLIP en arrière-plan (au démarrage de l'application)."""
+    return model_registry.warm_up(model_name, lambda: EmbeddingComparator(model_name))
+
+
+class AnalysisCancelled(Exception):
+    """Levée quand une analyse est annulée (via son `cancel_event`)."""
+
+
+def check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise AnalysisCancelled("Analyse annulée")
 
 
 # --- Classe ClipAnalysis ---
@@ -66,91 +126,121 @@ class ClipAnalysis:
         Initialise l'analyse avec un chemin facultatif pour la banque.
         """
         self.bank_path = bank_path
-        self.comparator = EmbeddingComparator()  # Assurez-vous que cette classe est correctement définie
-
-    def create_video_from_frames(self, frames_dir, output_path, fps, frame_extension=".jpg"):
-        """
-        Crée une vidéo à partir des frames d'un dossier donné.
-
-        Args:
-            frames_dir (str): Chemin vers le dossier contenant les frames.
-            output_path (str): Chemin de sortie pour la vidéo générée.
-            fps (int): Nombre d'images par seconde pour la vidéo.
-            frame_extension (str): Extension des frames (par défaut ".jpg").
-        """
-        frames = sorted(f for f in os.listdir(frames_dir) if f.endswith(frame_extension))
-        if not frames:
-            print(f"Error: No frames found in '{frames_dir}' with extension '{frame_extension}'")
-            return
-
-        first_frame = cv2.imread(os.path.join(frames_dir, frames[0]))
-        height, width, _ = first_frame.shape
-
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+        self.comparator = get_comparator()  # Modèle partagé via le registre, chargé une seule fois
 
-        for frame_filename in frames:
-            frame = cv2.imread(os.path.join(frames_dir, frame_filename))
-            out.write(frame)
-
-        out.release()
-        print(f"Video saved to '{output_path}'")
-        
-    def analyse_prompt(self, analysis_path, prompt, similarity_threshold=None):
+    def analyse_prompt(self, analysis_path, prompt, similarity_threshold=None, collections=None, time_range=None,
+                       progress_callback=None, cancel_event=None, copy_frames=False):
         """
         Analyse un prompt en comparant les embeddings du prompt avec ceux des images dans chaque collection.
         Inclut un dossier pour les Top5 et un autre pour les frames au-dessus d'un seuil de similarité.
+        `collections` (toutes par défaut) et `time_range=(t0, t1)` (secondes dans la vidéo) limitent
+        la recherche ; le reste de la base n'est pas parcouru.
+        Voir `analyse_prompts` pour `progress_callback`, `cancel_event` et `copy_frames`.
         """
-        comparator = self.comparator
-        text_embedding = comparator.encode_text(prompt)  # Étape 1 : Encoder le prompt
-        print(f"🔍 Embedding du prompt '{prompt}' : {text_embedding}")
+        return self.analyse_prompts(
+            analysis_path, [prompt], similarity_threshold, collections, time_range,
+            progress_callback=progress_callback, cancel_event=cancel_event, copy_frames=copy_frames,
+        )[0]
 
-        # Étape 2 : Comparer les embeddings dans chaque collection
+    def analyse_prompts(self, analysis_path, prompts, similarity_threshold=None, collections=None, time_range=None,
+                        progress_callback=None, cancel_event=None, copy_frames=False):
+        """
+        Analyse plusieurs prompts d'un coup (prompts standards d'un rapport de poste par exemple).
+        Les prompts sont encodés en une seule passe du modèle et chaque shard FAISS n'est parcouru
+        qu'une fois pour toutes les requêtes. Un dossier de résultats est créé par prompt.
+        Avec `progress_callback(prompt, collection, top_k)`, les collections sont interrogées une par une
+        et leur Top 5 ([{"id", "similarity"}]) est transmis dès qu'il est connu.
+        `cancel_event` (threading.Event) interrompt l'analyse entre deux étapes (AnalysisCancelled).
+        La vidéo des frames au-dessus du seuil est écrite directement depuis la vidéo source ;
+        avec `copy_frames=True`, les miniatures sont aussi copiées dans AbTH_Frames.
+        Returns:
+            list: Dossiers de résultats, dans l'ordre des prompts.
+        """
+        prompts = list(prompts)
+        text_embeddings = self.comparator.encode_text(prompts)  # Étape 1 : Encoder les prompts
+        check_cancelled(cancel_event)
+
+        # Étape 2 : Interroger FAISS, qui renvoie directement la similarité cosinus
+        best_matches = faiss_client.search_batch(text_embeddings, k=1, collections=collections, time_range=time_range)
+        thresholds = []
+        for prompt, text_embedding, best_match in zip(prompts, text_embeddings, best_matches):
+            print(f"🔍 Embedding du prompt '{prompt}' : {text_embedding}")
+            threshold = similarity_threshold
+            # Calculer le seuil de similarité si non fourni
+            if threshold is None:
+                # Similarité maximale globale (au moins 0, comme pour un seuil par défaut)
+                global_max_similarity = max(0.0, best_match[0]["similarity"]) if best_match else 0.0
+                threshold = global_max_similarity * 0.9  # 90% de la similarité maximale globale
+                print(f"🔧 Similarity threshold calculé pour '{prompt}' : {threshold}")
+            thresholds.append(threshold)
+
+        check_cancelled(cancel_event)
+        scope = faiss_client.scoped_collections(collections, time_range)
+        if progress_callback is None:
+            # Récupérer en une seule recherche toutes les frames au-dessus du seuil de chaque prompt
+            hits = faiss_client.range_search_batch(
+                text_embeddings, thresholds, collections=collections, time_range=time_range
+            )
+        else:
+            hits = self._range_search_progressive(
+                text_embeddings, prompts, thresholds, scope, time_range, progress_callback, cancel_event
+            )
+        return [
+            self._write_prompt_report(
+                analysis_path, prompt, threshold, ids, similarities, len(scope), cancel_event, copy_frames
+            )
+            for prompt, threshold, (ids, similarities) in zip(prompts, thresholds, hits)
+        ]
+
+    def _range_search_progressive(self, text_embeddings, prompts, thresholds, collections, time_range,
+                                  progress_callback, cancel_event, top_k=5):
+        """
+        `range_search_batch` collection par collection : le Top `top_k` de chaque collection est
+        transmis à `progress_callback` dès sa recherche terminée. Mêmes résultats que la recherche globale.
+        `collections` : collections à interroger, déjà restreintes par `scoped_collections`.
+        """
+        parts = [[] for _ in prompts]
+        for collection_name in collections:
+            check_cancelled(cancel_event)
+            hits = faiss_client.range_search_batch(
+                text_embeddings, thresholds, collections=[collection_name], time_range=time_range
+            )
+            for prompt, part, (ids, similarities) in zip(prompts, parts, hits):
+                part.append((ids, similarities))
+                if len(ids):
+                    top = [
+                        {"id": faiss_client.metadata[int(frame_id)]["name"], "similarity": float(similarity)}
+                        for frame_id, similarity in zip(ids[:top_k], similarities[:top_k])
+                    ]
+                    progress_callback(prompt, collection_name, top)
+
+        hits = []
+        for part in parts:
+            ids = np.concatenate([np.empty(0, dtype=np.int64)] + [part_ids for part_ids, _ in part])
+            similarities = np.concatenate([np.empty(0, dtype=np.float32)] + [part_sims for _, part_sims in part])
+            order = np.argsort(-similarities, kind="stable")
+            hits.append((ids[order], similarities[order]))
+        return hits
+
+    def _write_prompt_report(self, analysis_path, prompt, similarity_threshold, ids, similarities, searched_collections,
+                             cancel_event=None, copy_frames=False):
+        """
+        Écrit le dossier de résultats d'un prompt à partir des frames au-dessus du seuil
+        (ids et similarités triés par similarité décroissante).
+        `searched_collections` : nombre de collections interrogées (après filtre par collection et par temps).
+        """
         top_k = 5  # Nombre de résultats à retourner par collection
         collections_results = {}
-        filtered_results = {}
-        global_max_similarity = 0.0  # Initialiser la similarité maximale globale à 0
-
-        # Parcourir chaque collection pour calculer les similarités
-        for collection_name in set(meta["collection"] for meta in faiss_client.metadata.values()):
-            # Filtrer les embeddings de la collection
-            collection_embeddings = [
-                (idx, meta) for idx, meta in faiss_client.metadata.items()
-                if meta["collection"] == collection_name
-            ]
-
-            if not collection_embeddings:
-                print(f"⚠️ Aucun embedding disponible pour la collection '{collection_name}'.")
-                continue
-
-            # Comparer chaque embedding avec le prompt
-            all_results = []  # Stocker toutes les frames pour cette collection
-            for idx, meta in collection_embeddings:
-                try:
-                    image_embedding = faiss_client.index.reconstruct(idx)
-                    similarity = comparator.compare_embeddings(text_embedding, [image_embedding])
-                    all_results.append({"id": meta["name"], "similarity": similarity})
-
-                    # Mettre à jour la similarité maximale globale si nécessaire
-                    if similarity > global_max_similarity:
-                        global_max_similarity = similarity
-                except Exception as e:
-                    print(f"❌ Erreur lors de la reconstruction de l'embedding pour l'indice {idx}: {e}")
-                    continue
-
-            # Trier toutes les frames par similarité décroissante
-            all_results = sorted(all_results, key=lambda x: x["similarity"], reverse=True)
-
-            # Garder uniquement le Top 5 pour cette collection
-            collections_results[collection_name] = all_results[:top_k]
-
-            # Filtrer les frames au-dessus du seuil pour cette collection
-            filtered_results[collection_name] = all_results
-
-        # Calculer le seuil de similarité si non fourni
-        if similarity_threshold is None:
-            similarity_threshold = global_max_similarity * 0.9  # 90% de la similarité maximale globale
-            print(f"🔧 Similarity threshold calculé : {similarity_threshold}")
+        filtered_results = {}  # collection -> frames au-dessus du seuil, triées par similarité décroissante
+        for frame_id, similarity in zip(ids, similarities):
+            meta = faiss_client.metadata[int(frame_id)]
+            filtered_results.setdefault(meta["collection"], []).append(
+                {"id": meta["name"], "similarity": float(similarity), "frame_index": meta.get("frame_index")}
+            )
+
+        # Garder uniquement le Top 5 pour chaque collection
+        for collection_name, results in filtered_results.items():
+            collections_results[collection_name] = results[:top_k]
 
         # Étape 3 : Créer un dossier pour enregistrer les résultats
         request_folder = os.path.join(analysis_path, f"Request_{prompt}")
@@ -165,7 +255,8 @@ class ClipAnalysis:
             abth_info_file.write(f"Date: {datetime.now()}\n")
             abth_info_file.write(f"Prompt: {prompt}\n")
             abth_info_file.write(f"Similarity Threshold: {similarity_threshold}\n")
-            abth_info_file.write(f"Number of collections: {len(filtered_results)}\n\n")
+            abth_info_file.write(f"Number of collections: {searched_collections}\n")
+            abth_info_file.write(f"Collections with results: {len(filtered_results)}\n\n")
 
             # Écrire une matrice des meilleurs résultats pour chaque collection
             abth_info_file.write("Matrix of Best Results per Collection:\n")
@@ -173,10 +264,9 @@ class ClipAnalysis:
             abth_info_file.write("-" * 90 + "\n")
 
             for collection_name, results in filtered_results.items():
-                # Filtrer les frames au-dessus du seuil pour cette collection
-                above_threshold_frames = [
-                    result for result in results if result["similarity"] >= similarity_threshold
-                ]
+                check_cancelled(cancel_event)  # Copie des frames et rendu vidéo : étapes les plus longues
+                # Frames au-dessus du seuil pour cette collection (déjà filtrées par FAISS)
+                above_threshold_frames = results
 
                 if above_threshold_frames:  # Vérifier s'il y a des frames au-dessus du seuil
                     # Trouver le meilleur résultat dans la collection
@@ -191,24 +281,26 @@ class ClipAnalysis:
                     # Écrire les informations dans la matrice
                     abth_info_file.write(f"{collection_name:<20}{best_frame:<30}{best_similarity:<10.4f}{total_frames:<15}{avg_similarity:<15.4f}\n")
 
-                    # Créer un dossier parent "AbTH_Frames" pour toutes les collections
-                    frames_folder = os.path.join(AbTH_folder, "AbTH_Frames")
-                    os.makedirs(frames_folder, exist_ok=True)
-
-                    # Créer un sous-dossier pour chaque collection dans "AbTH_Frames"
-                    collection_folder = os.path.join(frames_folder, f"AbTH_{collection_name}")
-                    os.makedirs(collection_folder, exist_ok=True)
-
-                    # Copier les images correspondantes dans le sous-dossier de la collection
-                    for result in above_threshold_frames:
-                        image_id = result["id"]
-                        image_folder = f"{collection_name}_frames"
-                        image_path = os.path.join("Bank", "Frames", image_folder, image_id)
-                        if os.path.exists(image_path):
-                            shutil.copy(image_path, os.path.join(collection_folder, os.path.basename(image_id)))
-
-                    # Créer une vidéo à partir des frames au-dessus du seuil
+                    bank_path = self.bank_path or "Bank"
+                    if copy_frames:
+                        # Créer un dossier parent "AbTH_Frames" pour toutes les collections
+                        frames_folder = os.path.join(AbTH_folder, "AbTH_Frames")
+                        os.makedirs(frames_folder, exist_ok=True)
+
+                        # Créer un sous-dossier pour chaque collection dans "AbTH_Frames"
+                        collection_folder = os.path.join(frames_folder, f"AbTH_{collection_name}")
+                        os.makedirs(collection_folder, exist_ok=True)
+
+                        # Copier les images correspondantes dans le sous-dossier de la collection
+                        for result in above_threshold_frames:
+                            image_id = result["id"]
+                            image_folder = f"{collection_name}_frames"
+                            image_path = os.path.join(bank_path, "Frames", image_folder, image_id)
+                            if os.path.exists(image_path):
+                                shutil.copy(image_path, os.path.join(collection_folder, os.path.basename(image_id)))
+
+                    # Créer une vidéo des frames au-dessus du seuil, lues directement dans la vidéo source
                     video_output_path = os.path.join(AbTH_folder, f"{collection_name}_above_threshold.mp4")
-                    self.create_video_from_frames(collection_folder, video_output_path, fps=30, frame_extension=".jpg")
+                    write_result_clip(video_output_path, collection_name, above_threshold_frames, bank_path, fps=30)
 
         return request_folder
\ No newline at end of file
@@ -0,0 +1,112 @@
+from imports import np, os
+from collections import OrderedDict
+import threading
+
+
+def normalize_prompt(text):
+    """Forme canonique d'un prompt (le tokenizer CLIP ignore la casse et les espaces multiples)."""
+    return " ".join(text.lower().split())
+
+
+class TextEmbeddingCache:
+    """
+    Cache LRU borné des embeddings de texte, indexé par (nom du modèle, prompt normalisé).
+    Les prompts relancés toute la journée ne repassent plus par l'encodeur de texte.
+    Avec `path`, le cache est relu au démarrage ; il est réécrit (fichier .npz) par `save()`,
+    appelé à la fermeture de l'application et non à chaque prompt.
+    """
+    def __init__(self, max_entries=1024, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.entries = OrderedDict()  # (modèle, prompt normalisé) -> embedding (np.ndarray float32)
+        self.lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Une seule écriture du fichier à la fois
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False  # Des entrées ont été ajoutées depuis le dernier chargement / la dernière sauvegarde
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, model_name, text):
+        """Embedding en cache pour ce prompt (None si absent)."""
+        key = (model_name, normalize_prompt(text))
+        with self.lock:
+            embedding = self.entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, model_name, text, embedding):
+        """Ajoute un embedding ; l'entrée la moins récemment utilisée est retirée au-delà de `max_entries`."""
+        embedding = np.array(embedding, dtype=np.float32).reshape(-1)
+        embedding.flags.writeable = False  # Partagé entre les appelants
+        key = (model_name, normalize_prompt(text))
+        with self.lock:
+            self.entries[key] = embedding
+            self.entries.move_to_end(key)
+            self.dirty = True
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Taille du cache et compteurs de succès / échecs."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+    # --- Persistance ---
+
+    def save(self, path=None):
+        """
+        Écrit le cache (de la plus ancienne à la plus récente entrée) dans un fichier .npz, de façon atomique.
+        Sans nouvelle entrée depuis la dernière écriture, le fichier n'est pas réécrit.
+        """
+        path = path or self.path
+        if not path or not self.dirty:
+            return
+        with self.lock:
+            keys = list(self.entries)
+            embeddings = list(self.entries.values())
+            self.dirty = False
+        # Les modèles peuvent avoir des dimensions différentes : vecteurs concaténés + dimension de chacun
+        data = {
+            "models": np.array([model for model, _ in keys], dtype=str),
+            "texts": np.array([text for _, text in keys], dtype=str),
+            "dims": np.array([len(embedding) for embedding in embeddings], dtype=np.int64),
+            "vectors": np.concatenate(embeddings) if embeddings else np.empty(0, dtype=np.float32),
+        }
+        tmp_path = path + ".tmp"
+        with self._save_lock:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **data)
+            os.replace(tmp_path, path)
+
+    def load(self, path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                models, texts, dims, vectors = data["models"], data["texts"], data["dims"], data["vectors"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Cache d'embeddings illisible ('{path}'), ignoré : {e}")
+            return
+        ends = np.cumsum(dims)
+        for model, text, end, dim in zip(models, texts, ends, dims):
+            self.put(str(model), str(text), vectors[end - dim:end])
+        self.dirty = False
+        print(f"✅ Cache d'embeddings de texte chargé ({len(self.entries)} prompts).")
@@ -1,102 +1,758 @@
-from imports import np, faiss, os, json
+from imports import np, faiss, os, json, shutil
+from AI_Models.faiss_shard import FaissShard, shard_file_name, index_ids, trim_file
+from AI_Models.metadata_store import MetadataStore
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+METRICS = {
+    "ip": faiss.METRIC_INNER_PRODUCT,  # Similarité cosinus pour des vecteurs normalisés (CLIP)
+    "l2": faiss.METRIC_L2,
+}
+
+# Types d'index : recherche exacte ("flat") ou approchée (HNSW, IVF, IVF-PQ)
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+LOSSY_INDEX_TYPES = ("ivfpq",)  # Index qui ne gardent qu'une approximation des vecteurs
+
+def index_type_of(index):
+    """Retourne le type ("flat", "hnsw", "ivf" ou "ivfpq") d'un index FAISS."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+def shards_dir(path):
+    """Dossier des shards d'une base (`data.faiss` -> `data_shards/`)."""
+    return path.replace(".faiss", "_shards")
 
 class FaissClient:
-    def __init__(self, dimension):
+    """
+    Base de vecteurs CLIP découpée en un shard FAISS par collection.
+    Les shards sont lus à la demande (au premier accès d'une requête), déchargés au-delà de
+    `memory_budget_mb` (les moins récemment utilisés d'abord) et interrogés en parallèle
+    quand une requête porte sur plusieurs collections.
+    La persistance est incrémentale : une sauvegarde ajoute les nouveaux vecteurs au segment
+    de leur shard et les changements de métadonnées au journal (`_metadata.wal`) ; une
+    compaction en arrière-plan replie segments et journal dès qu'ils dépassent `compact_ratio`
+    de la taille de leur fichier de base.
+    Avec `mmap=True`, l'index de base d'un shard est projeté en mémoire (lecture seule) au lieu
+    d'être copié : l'ouverture ne dépend plus de sa taille et plusieurs processus partagent les pages.
+    """
+    def __init__(self, dimension, metric="ip", nprobe=16, ef_search=64, memory_budget_mb=None, search_threads=4,
+                 compact_ratio=0.25, mmap=True):
         self.dimension = dimension
-        self.index = faiss.IndexFlatL2(self.dimension)  # Index global pour toutes les collections
-        self.metadata = {}  # Dictionnaire pour stocker les métadonnées {id: {"collection": ..., "name": ...}}
+        self.metric = METRICS[metric]
+        self.index_type = "flat"  # Passer à un index approché avec build_index()
+        self.index_params = {}  # Paramètres de construction de l'index approché courant
+        self.nprobe = nprobe  # Listes IVF visitées par requête (ivf, ivfpq)
+        self.ef_search = ef_search  # Largeur de la recherche HNSW par requête (hnsw)
+        self.shards = {}  # Un index par collection : {collection: FaissShard}
+        self.path = None  # Fichier de la base (data.faiss), connu après load() ou save()
+        self.memory_budget_mb = memory_budget_mb  # None : aucun shard n'est déchargé
+        self.search_threads = search_threads  # Shards interrogés en parallèle
+        self.compact_ratio = compact_ratio  # Taille segment / base au-delà de laquelle compacter
+        self.mmap = mmap  # Projeter les index de base en mémoire plutôt que les lire
+        self.metadata = MetadataStore()  # Métadonnées en colonnes ; self.metadata[id] -> {"collection": ..., "name": ...}
         self.next_id = 0  # ID unique pour chaque embedding
+        self.lock = threading.RLock()  # Protège les shards et les métadonnées entre uploads concurrents
+        self._executor = None
+        self._wal = []  # Opérations sur les métadonnées pas encore écrites dans le journal
+        self._compaction_lock = threading.Lock()  # Une seule compaction à la fois (à prendre avant self.lock)
+        self._compactor = None  # Thread de compaction en arrière-plan
 
-    def add_to_collection(self, collection_name, ids, embeddings):
+    def add_to_collection(self, collection_name, ids, embeddings, frame_indices=None, timestamps=None):
         """
         Ajoute des embeddings à une collection spécifique.
+        `frame_indices` et `timestamps` (secondes) situent chaque frame dans la vidéo source.
+        """
+        with self.lock:
+            embeddings = np.array(embeddings).astype('float32')
+            # Chaque vecteur est rangé sous son id de métadonnée : les suppressions ne décalent rien
+            index_ids = np.arange(self.next_id, self.next_id + len(embeddings), dtype=np.int64)
+            if collection_name in self.shards:
+                # Shard existant : pas besoin de le charger, les vecteurs iront dans son segment
+                self.shards[collection_name].add(index_ids, embeddings)
+            else:
+                index = self.create_index(self.index_type, embeddings, ids=index_ids, **self.index_params)
+                raw = (index_ids, embeddings) if self.index_type in LOSSY_INDEX_TYPES else None
+                self.shards[collection_name] = FaissShard(
+                    collection_name, self.dimension, path=self._shard_path(collection_name), index=index, mmap=self.mmap,
+                    raw=raw,
+                )
+
+            op = {"op": "add", "collection": collection_name, "first_id": self.next_id, "names": list(ids)}
+            if frame_indices is not None:
+                op["frame_indices"] = [int(i) for i in frame_indices]
+            if timestamps is not None:
+                op["timestamps"] = [float(t) for t in timestamps]
+            self._apply(op)
+            self._wal.append(op)
+            self._enforce_memory_budget(keep=(collection_name,))
+
+            print(f"✅ {len(embeddings)} embeddings ajoutés à la collection '{collection_name}'.")
+
+    def _new_index(self):
+        """Crée un index exact vide pour la métrique configurée, adressé par ids."""
+        if self.metric == faiss.METRIC_INNER_PRODUCT:
+            return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(self.dimension))
+
+    def create_index(self, index_type, vectors, ids=None, sample_size=100000, nlist=None, hnsw_m=32, pq_m=64, pq_nbits=8):
+        """
+        Construit un index du type demandé contenant `vectors`, chacun rangé sous son id de `ids`
+        (par défaut 0..N-1). Les recherches renvoient ces ids, quel que soit le type d'index.
+        Les index IVF sont entraînés sur un échantillon aléatoire d'au plus `sample_size` vecteurs.
+        Args:
+            index_type (str): "flat", "hnsw", "ivf" ou "ivfpq".
+            nlist (int): Nombre de listes IVF (par défaut ~4·sqrt(N)).
+            hnsw_m (int): Nombre de voisins par nœud du graphe HNSW.
+            pq_m, pq_nbits (int): Sous-vecteurs et bits par code pour IVF-PQ (m doit diviser la dimension).
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"❌ Type d'index inconnu : '{index_type}' (attendu : {', '.join(INDEX_TYPES)})")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        ids = np.arange(n, dtype=np.int64) if ids is None else np.ascontiguousarray(ids, dtype=np.int64)
+        if index_type in ("ivf", "ivfpq") and n == 0:
+            # Rien pour entraîner les centroïdes (vidéo vide ou illisible) : index exact
+            print("⚠️ Aucun vecteur : trop peu pour un index IVF, index exact utilisé.")
+            index_type = "flat"
+        elif index_type == "ivfpq" and n < 2 ** pq_nbits:
+            # Le quantificateur PQ a besoin d'au moins 2^nbits points (petit shard)
+            print(f"⚠️ {n} vecteurs : trop peu pour IVF-PQ, index IVF utilisé.")
+            index_type = "ivf"
+
+        if index_type == "flat":
+            index = self._new_index()
+        elif index_type == "hnsw":
+            index = faiss.index_factory(self.dimension, f"IDMap2,HNSW{hnsw_m},Flat", self.metric)
+        else:
+            if nlist is None:
+                nlist = int(4 * np.sqrt(n))
+            nlist = max(1, min(nlist, n // 39 or 1))  # FAISS recommande ~39 points d'entraînement par liste
+            codec = "Flat" if index_type == "ivf" else f"PQ{pq_m}x{pq_nbits}"
+            # Les listes IVF stockent déjà les ids : pas de IDMap2, une table de hachage suffit pour
+            # reconstruire et supprimer par id
+            index = faiss.index_factory(self.dimension, f"IVF{nlist},{codec}", self.metric)
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+        if not index.is_trained:
+            sample = vectors
+            if n > sample_size:
+                sample = vectors[np.random.default_rng(0).choice(n, sample_size, replace=False)]
+            print(f"🏋️ Entraînement de l'index '{index_type}' sur {len(sample)} vecteurs...")
+            index.train(sample)
+
+        if n:
+            index.add_with_ids(vectors, ids)
+        return index
+
+    def build_index(self, index_type, **params):
+        """
+        Reconstruit chaque shard avec un index de type `index_type` contenant les mêmes vecteurs
+        (voir create_index pour les paramètres). Les ids et métadonnées sont conservés.
+        Les shards sont traités un par un pour rester dans le budget mémoire.
+        Les shards IVF-PQ gardent leurs vecteurs d'origine (fichier .raw) : la reconstruction part de
+        ceux-ci, et non des approximations de l'index.
+        """
+        with self.lock:
+            before = after = count = 0
+            for collection_name, shard in self.shards.items():
+                indexes = self._load_shard(collection_name).indexes()
+                ids, vectors = self._shard_vectors(collection_name)
+                before += sum(index_memory_bytes(index) for index in indexes)
+                raw = (ids, vectors) if index_type in LOSSY_INDEX_TYPES else None
+                shard.rebuild(self.create_index(index_type, vectors, ids=ids, **params), raw)
+                after += index_memory_bytes(shard.index)
+                count += len(vectors)
+                self._enforce_memory_budget(keep=(collection_name,))
+            self.index_type = index_type
+            self.index_params = params
+            print(
+                f"✅ Index '{index_type}' construit ({count} vecteurs, {len(self.shards)} shards, "
+                f"{before / 2**20:.1f} Mo -> {after / 2**20:.1f} Mo)."
+            )
+
+    def search_params(self, nprobe=None, ef_search=None, index=None, selector=None):
+        """
+        Paramètres de recherche FAISS pour `index` ou le type d'index courant (None pour un index exact
+        sans filtre). `selector` (faiss.IDSelector) restreint la recherche à certains ids.
+        """
+        index_type = index_type_of(index) if index is not None else self.index_type
+        if index_type in ("ivf", "ivfpq"):
+            return faiss.SearchParametersIVF(nprobe=nprobe or self.nprobe, sel=selector)
+        if index_type == "hnsw":
+            return faiss.SearchParametersHNSW(efSearch=ef_search or self.ef_search, sel=selector)
+        return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+    def _scope(self, collections, time_range):
+        """
+        Collections à interroger et filtre d'ids FAISS pour une fenêtre de temps (None : pas de filtre).
+        Les ids retenus viennent des colonnes de métadonnées des seules collections demandées.
+        """
+        if time_range is None:
+            return collections, None
+        selected = self.metadata.ids_in_time_range(time_range, collections)
+        if not selected:
+            return [], None
+        return list(selected), faiss.IDSelectorBatch(np.concatenate(list(selected.values())))
+
+    def _shard_vectors(self, collection_name):
+        """
+        Vecteurs d'un shard : ceux d'origine s'il les garde, sinon ceux reconstruits depuis ses index
+        (avec un avertissement si l'index est à perte : ce ne sont alors que des approximations).
+        Returns:
+            tuple: (ids croissants, np.ndarray (N, dimension) dans le même ordre).
+        """
+        raw = self.shards[collection_name].raw_vectors()
+        if raw is not None:
+            return raw
+        indexes = self._load_shard(collection_name).indexes()
+        if any(index_type_of(index) in LOSSY_INDEX_TYPES for index in indexes):
+            print(f"⚠️ Shard '{collection_name}' : vecteurs d'origine indisponibles, approximations de l'index utilisées.")
+        parts = [self._all_vectors(index) for index in indexes]
+        ids = np.concatenate([part_ids for part_ids, _ in parts])
+        vectors = np.concatenate([part_vectors for _, part_vectors in parts])
+        order = np.argsort(ids, kind="stable")
+        return ids[order], vectors[order]
+
+    def _all_vectors(self, index):
+        """
+        Reconstruit tous les vecteurs d'un index (approximés pour IVF-PQ).
+        Returns:
+            tuple: (ids croissants, np.ndarray (N, dimension) dans le même ordre).
+        """
+        if index.ntotal == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dimension), dtype=np.float32)
+        index = faiss.downcast_index(index)
+        ids = index_ids(index)
+        if isinstance(index, faiss.IndexIDMap):
+            vectors = index.index.reconstruct_n(0, index.ntotal)
+        elif faiss.try_extract_index_ivf(index) is None:
+            vectors = index.reconstruct_n(0, index.ntotal)
+        else:
+            ivf = faiss.extract_index_ivf(index)
+            if ivf.direct_map.type != faiss.DirectMap.Hashtable:
+                ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            vectors = ivf.reconstruct_batch(ids)
+        order = np.argsort(ids, kind="stable")
+        return ids[order], vectors[order]
+
+    def to_similarity(self, scores):
+        """
+        Convertit les scores FAISS en similarité cosinus.
+        Pour un index L2 (vecteurs normalisés), FAISS renvoie ||a - b||² = 2 - 2·cos.
+        """
+        scores = np.asarray(scores, dtype=np.float32)
+        if self.metric == faiss.METRIC_INNER_PRODUCT:
+            return scores
+        return 1.0 - scores / 2.0
+
+    def search(self, query_embedding, k=5, nprobe=None, ef_search=None, collections=None, time_range=None):
+        """
+        Recherche les k embeddings les plus proches dans les shards des collections demandées
+        (toutes par défaut). Chaque résultat contient l'id, la collection, le nom de la frame et
+        sa similarité cosinus.
+        `time_range=(t0, t1)` (secondes dans la vidéo, bornes incluses, None pour une borne ouverte)
+        limite la recherche aux frames de cet intervalle, filtrées par FAISS pendant la recherche.
+        `nprobe` (IVF) et `ef_search` (HNSW) remplacent les réglages par défaut pour cette requête.
+        """
+        return self.search_batch(query_embedding, k, nprobe, ef_search, collections, time_range)[0]
+
+    def search_batch(self, query_embeddings, k=5, nprobe=None, ef_search=None, collections=None, time_range=None):
+        """
+        Recherche les k plus proches voisins de plusieurs requêtes en un seul appel FAISS par shard
+        (chaque shard n'est parcouru qu'une fois pour toutes les requêtes).
+        Args:
+            query_embeddings (np.ndarray): Requêtes (Q, dimension).
+        Returns:
+            list: Une liste de résultats par requête, dans l'ordre des requêtes (voir `search`).
+        """
+        queries = np.ascontiguousarray(np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dimension))
+
+        with self.lock:
+            collections, selector = self._scope(collections, time_range)
+
+            def search_shard(index):
+                params = self.search_params(nprobe, ef_search, index=index, selector=selector)
+                return index.search(queries, k, params=params)
+
+            hits = self._map_shards(search_shard, collections)
+            if not hits:
+                return [[] for _ in range(len(queries))]
+            # (Q, k * nombre d'index) : les k meilleurs résultats de chaque shard, côte à côte
+            scores = np.concatenate([shard_scores for shard_scores, _ in hits], axis=1)
+            indices = np.concatenate([shard_indices for _, shard_indices in hits], axis=1)
+            similarities = self.to_similarity(scores)
+            order = np.argsort(-similarities, axis=1, kind="stable")
+            batch_results = []
+
+            # Fusion des k meilleurs résultats de chaque shard, requête par requête
+            for q in range(len(queries)):
+                results = []
+                for i in order[q]:
+                    idx = int(indices[q, i])
+                    metadata = self.metadata.get(idx)
+                    if idx == -1 or metadata is None:
+                        continue
+                    results.append({
+                        "id": idx,
+                        "collection": metadata["collection"],
+                        "name": metadata["name"],
+                        "similarity": float(similarities[q, i]),
+                        "distance": float(scores[q, i]),
+                    })
+                    if len(results) == k:
+                        break
+                batch_results.append(results)
+
+        return batch_results
+
+    def range_search(self, query_embedding, min_similarity, nprobe=None, ef_search=None, collections=None, time_range=None):
+        """
+        Retourne tous les embeddings dont la similarité cosinus avec la requête dépasse `min_similarity`,
+        dans les collections demandées (toutes par défaut) et la fenêtre `time_range` (voir `search`).
+        Returns:
+            tuple: (ids de métadonnée, similarités), triés par similarité décroissante.
+        """
+        return self.range_search_batch(query_embedding, min_similarity, nprobe, ef_search, collections, time_range)[0]
+
+    def range_search_batch(self, query_embeddings, min_similarities, nprobe=None, ef_search=None, collections=None, time_range=None):
+        """
+        `range_search` pour plusieurs requêtes, chacune avec son seuil (ou un seuil commun), en un seul
+        appel FAISS par shard : le rayon le plus large est cherché, puis chaque requête garde ses résultats.
+        Returns:
+            list: Un tuple (ids, similarités) par requête, triés par similarité décroissante.
+        """
+        queries = np.ascontiguousarray(np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dimension))
+        min_similarities = np.broadcast_to(np.asarray(min_similarities, dtype=np.float64), (len(queries),))
+        # FAISS exclut la borne : la marger légèrement pour inclure les similarités égales au seuil
+        inner_product = self.metric == faiss.METRIC_INNER_PRODUCT
+        if inner_product:
+            radii = min_similarities - 1e-6
+            radius = float(radii.min())
+        else:
+            radii = 2.0 - 2.0 * min_similarities + 1e-6
+            radius = float(radii.max())
+
+        with self.lock:
+            collections, selector = self._scope(collections, time_range)
+
+            def range_search_shard(index):
+                if index.ntotal == 0:
+                    return np.zeros(len(queries) + 1, dtype=np.int64), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+                params = self.search_params(nprobe, ef_search, index=index, selector=selector)
+                lims, scores, indices = index.range_search(queries, radius, params=params)
+                return lims, scores, indices.astype(np.int64)
+
+            hits = self._map_shards(range_search_shard, collections)
+
+        batch_results = []
+        for q in range(len(queries)):
+            if not hits:
+                batch_results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                continue
+            scores = np.concatenate([shard_scores[lims[q]:lims[q + 1]] for lims, shard_scores, _ in hits])
+            ids = np.concatenate([shard_ids[lims[q]:lims[q + 1]] for lims, _, shard_ids in hits])
+            keep = scores > radii[q] if inner_product else scores < radii[q]
+            similarities = self.to_similarity(scores[keep])
+            order = np.argsort(-similarities, kind="stable")
+            batch_results.append((ids[keep][order], similarities[order]))
+        return batch_results
+
+    def get_embeddings(self):
+        """
+        Retourne tous les vecteurs de la base en une seule matrice (vecteurs d'origine pour les shards IVF-PQ).
+        Returns:
+            tuple: (ids de métadonnée croissants, np.ndarray (N, dimension)).
         """
-        embeddings = np.array(embeddings).astype('float32')
-        self.index.add(embeddings)
+        with self.lock:
+            parts = [self._shard_vectors(collection_name) for collection_name in self.shards]
+            self._enforce_memory_budget()
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dimension), dtype=np.float32)
+        ids = np.concatenate([shard_ids for shard_ids, _ in parts])
+        vectors = np.concatenate([shard_vectors for _, shard_vectors in parts])
+        order = np.argsort(ids, kind="stable")
+        return ids[order], vectors[order]
 
-        for i, frame_name in enumerate(ids):
-            self.metadata[self.next_id] = {"collection": collection_name, "name": frame_name}
-            self.next_id += 1
+    def collection_ids(self):
+        """
+        Retourne, pour chaque collection, le tableau (croissant) des ids qui lui appartiennent.
+        Les ids viennent de l'index inversé des métadonnées, tenu à jour à chaque ajout / suppression.
+        """
+        with self.lock:
+            return self.metadata.collection_ids()
 
-        print(f"✅ {len(embeddings)} embeddings ajoutés à la collection '{collection_name}'.")
+    def collection_counts(self):
+        """Retourne le nombre de frames de chaque collection."""
+        with self.lock:
+            return self.metadata.collection_counts()
 
-    def search(self, query_embedding, k=5):
+    def scoped_collections(self, collections=None, time_range=None):
         """
-        Recherche les k embeddings les plus proches dans l'index global.
+        Collections réellement interrogées par une recherche limitée à `collections` (toutes par défaut)
+        et à `time_range` : les collections inconnues, et celles sans frame dans la fenêtre, sont écartées.
         """
-        query_embedding = np.array(query_embedding).astype('float32').reshape(1, -1)
-        distances, indices = self.index.search(query_embedding, k)
-        results = []
+        with self.lock:
+            collections, _ = self._scope(collections, time_range)
+            if collections is None:
+                return list(self.shards)
+            return [name for name in collections if name in self.shards]
+
+    def _apply(self, op):
+        """Applique aux métadonnées une opération du journal ("add" ou "delete")."""
+        if op["op"] == "add":
+            self.metadata.append(
+                op["collection"], op["first_id"], op["names"],
+                frame_indices=op.get("frame_indices"), timestamps=op.get("timestamps"),
+            )
+            self.next_id = max(self.next_id, op["first_id"] + len(op["names"]))
+        elif op["op"] == "delete":
+            self.metadata.delete_collection(op["collection"])
 
-        for i, idx in enumerate(indices[0]):
-            if idx != -1:
-                metadata = self.metadata[idx]
-                results.append({
-                    "collection": metadata["collection"],
-                    "name": metadata["name"],
-                    "distance": distances[0][i]
-                })
+    # --- Shards ---
 
+    def _shard_path(self, collection_name):
+        if self.path is None:
+            return None
+        return os.path.join(shards_dir(self.path), shard_file_name(collection_name))
+
+    def _load_shard(self, collection_name):
+        """Shard d'une collection, lu (ou projeté) depuis le disque au premier accès."""
+        shard = self.shards[collection_name]
+        shard.touch()
+        if not shard.loaded:
+            shard.load()
+            self._enforce_memory_budget(keep=(collection_name,))
+        return shard
+
+    def _map_shards(self, fn, collections=None):
+        """
+        Applique `fn(index)` aux shards des collections demandées (toutes par défaut),
+        en parallèle s'il y en a plusieurs. Les collections inconnues sont ignorées.
+        Un shard projeté en mémoire compte pour deux index : sa base et son delta.
+        """
+        names = list(self.shards) if collections is None else [name for name in collections if name in self.shards]
+        indexes = [index for name in names for index in self._load_shard(name).indexes()]
+        if len(indexes) > 1 and self.search_threads > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.search_threads, thread_name_prefix="faiss-shard")
+            results = list(self._executor.map(fn, indexes))  # FAISS libère le GIL pendant la recherche
+        else:
+            results = [fn(index) for index in indexes]
+        self._enforce_memory_budget()
         return results
 
+    def _enforce_memory_budget(self, keep=()):
+        """
+        Décharge les shards les moins récemment utilisés tant que la mémoire estimée dépasse
+        le budget. Un shard modifié est d'abord écrit dans son fichier ; sans fichier, il reste en mémoire.
+        """
+        if self.memory_budget_mb is None:
+            return
+        budget = self.memory_budget_mb * 2**20
+        total = sum(shard.memory_bytes(self.dimension) for shard in self.shards.values())
+        candidates = sorted(
+            (shard for shard in self.shards.values() if shard.loaded and shard.collection not in keep),
+            key=lambda shard: shard.last_used,
+        )
+        for shard in candidates:
+            if total <= budget:
+                break
+            if shard.dirty:
+                continue  # Index de base à réécrire : reste en mémoire jusqu'à la prochaine sauvegarde
+            total -= shard.memory_bytes(self.dimension)
+            shard.evict()
+
+    def shard_stats(self):
+        """Nombre de vecteurs, état et mémoire estimée de chaque shard."""
+        with self.lock:
+            counts = self.metadata.collection_counts()
+            return {
+                name: {
+                    "vectors": counts.get(name, 0),
+                    "loaded": shard.loaded,
+                    "mapped": shard.mapped,
+                    "dirty": shard.dirty,
+                    "memory_mb": round(shard.memory_bytes(self.dimension) / 2**20, 1),
+                }
+                for name, shard in self.shards.items()
+            }
+
+    # --- Persistance ---
+
     def save(self, path):
         """
-        Sauvegarde l'index FAISS et les métadonnées dans un fichier.
+        Sauvegarde incrémentale : ajoute les opérations sur les métadonnées au journal et les
+        nouveaux vecteurs au segment de leur shard. Seuls les shards nouveaux ou reconstruits
+        réécrivent leur index de base. Une compaction est lancée en arrière-plan si nécessaire.
+        Ne pas appeler en tenant `self.lock` (la compaction le reprend).
         """
-        # Sauvegarder l'index FAISS
-        faiss.write_index(self.index, path)
-        print(f"✅ Index FAISS sauvegardé dans '{path}'.")
+        with self.lock:
+            moved = path != self.path
+            if moved:
+                self._move_to(path)
+            os.makedirs(shards_dir(path), exist_ok=True)
+
+            # Le journal d'abord : un vecteur n'est jamais sur le disque sans ses métadonnées
+            self._flush_wal()
+            appended = sum(shard.flush() for shard in self.shards.values() if not shard.dirty)
+            rewrite = [name for name, shard in self.shards.items() if shard.dirty]
+
+            with open(os.path.join(shards_dir(path), "index.json"), "w") as f:
+                json.dump({
+                    "metric": "ip" if self.metric == faiss.METRIC_INNER_PRODUCT else "l2",
+                    "index_type": self.index_type,
+                    "index_params": self.index_params,
+                }, f)
+
+        for collection_name in rewrite:
+            self._compact_shard(collection_name)
+        if moved:
+            self._compact_metadata()
+        print(
+            f"✅ Base FAISS sauvegardée dans '{shards_dir(path)}' : {appended / 2**10:.0f} Ko ajoutés aux segments, "
+            f"{len(rewrite)} shard(s) réécrit(s)."
+        )
+        self._schedule_compaction()
 
-        # Sauvegarder les métadonnées dans un fichier JSON
-        metadata_path = path.replace(".faiss", "_metadata.json")
-        with open(metadata_path, "w") as f:
-            json.dump(self.metadata, f)
-        print(f"✅ Métadonnées sauvegardées dans '{metadata_path}'.")
+    def _move_to(self, path):
+        # Sauvegarde vers un nouvel emplacement : tous les shards y sont réécrits
+        raws = {}
+        for collection_name, shard in self.shards.items():
+            self._load_shard(collection_name).to_memory()  # Lu depuis l'ancien emplacement
+            raws[collection_name] = shard.raw_vectors()
+        self.path = path
+        for collection_name, shard in self.shards.items():
+            shard.path = self._shard_path(collection_name)
+            shard.rebuild(shard.index, raws[collection_name])
+
+    def _metadata_path(self):
+        return self.path.replace(".faiss", "_metadata.npz")
+
+    def _legacy_metadata_path(self):
+        return self.path.replace(".faiss", "_metadata.json")
+
+    def _wal_path(self):
+        return self.path.replace(".faiss", "_metadata.wal")
+
+    def _flush_wal(self):
+        # Une ligne JSON par opération, en ajout seul
+        if not self._wal:
+            return
+        lines = "".join(json.dumps(op) + "\n" for op in self._wal).encode("utf-8")
+        with open(self._wal_path(), "a+b") as f:
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    lines = b"\n" + lines  # Ligne incomplète laissée par un arrêt brutal
+            f.write(lines)
+        self._wal = []
+
+    # --- Compaction ---
+
+    def compact(self, force=True):
+        """
+        Replie les segments dans les index de base et le journal dans le fichier de métadonnées.
+        Avec `force=False`, seuls les fichiers dont le segment (ou le journal) dépasse
+        `compact_ratio` de leur base sont compactés.
+        """
+        with self.lock:
+            if self.path is None:
+                return
+            due = [
+                name for name, shard in self.shards.items()
+                if shard.dirty or shard.pending or shard.segment_bytes() > (0 if force else self.compact_ratio * shard.base_bytes())
+            ]
+            metadata_due = self._wal_bytes() > (0 if force else self.compact_ratio * self._metadata_bytes())
+        for collection_name in due:
+            self._compact_shard(collection_name)
+        if metadata_due:
+            self._compact_metadata()
+        if due or metadata_due:
+            print(f"🧹 Compaction terminée : {len(due)} shard(s){', métadonnées' if metadata_due else ''}.")
+
+    def _schedule_compaction(self):
+        """Lance une compaction en arrière-plan si un segment ou le journal est devenu trop gros."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, kwargs={"force": False}, daemon=True, name="faiss-compaction")
+        self._compactor.start()
+
+    def wait_for_compaction(self):
+        if self._compactor is not None:
+            self._compactor.join()
+
+    def _compact_shard(self, collection_name):
+        # L'index est figé sous le verrou, écrit sans verrou, puis le segment replié est tronqué
+        with self._compaction_lock:
+            with self.lock:
+                shard = self.shards.get(collection_name)
+                if shard is None:
+                    return
+                self._load_shard(collection_name)
+                # Les vecteurs figés peuvent être des ajouts pas encore sauvegardés : leurs métadonnées
+                # doivent être dans le journal avant que la base ne les contienne
+                self._flush_wal()
+                write, segment_length, version = shard.snapshot()
+            try:
+                write()
+            except Exception:
+                shard.dirty = True  # Les vecteurs figés ne sont plus en attente : réécrire à la prochaine sauvegarde
+                raise
+            with self.lock:
+                if self.shards.get(collection_name) is not shard:
+                    os.remove(shard.path + ".tmp")  # Collection supprimée pendant l'écriture
+                    shard.remove_files()
+                    return
+                shard.install_base(version)
+                shard.trim_segment(segment_length)
+
+    def _compact_metadata(self):
+        with self._compaction_lock:
+            with self.lock:
+                self._flush_wal()
+                snapshot = self.metadata.snapshot()
+                wal_length = self._wal_bytes()
+            MetadataStore.write(self._metadata_path(), snapshot)
+            with self.lock:
+                trim_file(self._wal_path(), wal_length)
+                if os.path.exists(self._legacy_metadata_path()):
+                    os.remove(self._legacy_metadata_path())  # Remplacé par le fichier en colonnes
+
+    def _wal_bytes(self):
+        return os.path.getsize(self._wal_path()) if os.path.exists(self._wal_path()) else 0
+
+    def _metadata_bytes(self):
+        return os.path.getsize(self._metadata_path()) if os.path.exists(self._metadata_path()) else 0
 
     def load(self, path):
         """
-        Charge l'index FAISS et les métadonnées depuis un fichier.
+        Charge les métadonnées et le manifeste des shards ; chaque shard ne sera lu
+        qu'à la première requête qui le concerne.
+        Une ancienne base à index unique (`data.faiss`) est découpée en shards au premier chargement.
         """
-        if os.path.exists(path):
-            # Charger l'index FAISS
-            self.index = faiss.read_index(path)
-            print(f"✅ Index FAISS chargé depuis '{path}'.")
+        with self.lock:
+            self.path = path
+            directory = shards_dir(path)
+            manifest_path = os.path.join(directory, "index.json")
+            if not os.path.exists(manifest_path) and not os.path.exists(path):
+                print(f"⚠️ Aucune base FAISS trouvée à '{path}'. Une nouvelle base sera créée.")
+                return
 
-            # Charger les métadonnées depuis un fichier JSON
-            metadata_path = path.replace(".faiss", "_metadata.json")
+            # Charger les métadonnées (colonnes .npz, ou ancien fichier JSON converti)
+            metadata_path = self._metadata_path()
             if os.path.exists(metadata_path):
-                with open(metadata_path, "r") as f:
-                    self.metadata = json.load(f)
-                # Convertir les clés en entiers (elles sont sauvegardées comme chaînes dans JSON)
-                self.metadata = {int(k): v for k, v in self.metadata.items()}
-                print(f"✅ Métadonnées chargées depuis '{metadata_path}'.")
-
-                # Mettre à jour self.next_id pour éviter les collisions d'IDs
-                if self.metadata:
-                    self.next_id = max(self.metadata.keys()) + 1
-                else:
-                    self.next_id = 0
+                self.metadata = MetadataStore.load(metadata_path)
+                print(f"✅ Métadonnées chargées depuis '{metadata_path}' ({len(self.metadata)} frames).")
+            elif os.path.exists(self._legacy_metadata_path()):
+                self.metadata = MetadataStore.from_json(self._legacy_metadata_path())
+                print(f"✅ Métadonnées converties depuis '{self._legacy_metadata_path()}' ({len(self.metadata)} frames).")
             else:
-                print(f"⚠️ Aucun fichier de métadonnées trouvé à '{metadata_path}'.")
-        else:
-            print(f"⚠️ Aucun fichier FAISS trouvé à '{path}'. Un nouvel index sera créé.")
+                self.metadata = MetadataStore()
+
+            # Mettre à jour self.next_id pour éviter les collisions d'IDs
+            self.next_id = self.metadata.max_id() + 1
+            self._replay_wal()
+            write_metadata = not os.path.exists(metadata_path) and len(self.metadata) > 0
+            legacy = not os.path.exists(manifest_path)
+            if legacy:
+                self._load_legacy(path)
+            else:
+                self._load_manifest(manifest_path)
+
+        # Hors de self.lock : la compaction et save() prennent _compaction_lock avant self.lock
+        if write_metadata:
+            self._compact_metadata()  # Écrire tout de suite le fichier en colonnes
+        if legacy:
+            self.save(path)
+            print(f"🔁 Base migrée en {len(self.shards)} shard(s) ; '{path}' n'est plus utilisé.")
+
+    def _load_manifest(self, manifest_path):
+        """Lit le manifeste des shards et référence le shard de chaque collection (sans le lire)."""
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        self.metric = METRICS[manifest.get("metric", "ip")]
+        self.index_type = manifest.get("index_type", "flat")
+        self.index_params = manifest.get("index_params", {})
+
+        self.shards = {}
+        for collection_name in self.metadata.collection_counts():
+            shard_path = self._shard_path(collection_name)
+            if os.path.exists(shard_path):
+                keep_raw = os.path.exists(shard_path[:-len(".faiss")] + ".raw")
+                self.shards[collection_name] = FaissShard(
+                    collection_name, self.dimension, path=shard_path, mmap=self.mmap, keep_raw=keep_raw
+                )
+            else:
+                print(f"⚠️ Shard introuvable pour la collection '{collection_name}' : '{shard_path}'.")
+        print(f"✅ {len(self.shards)} shard(s) FAISS référencé(s) dans '{os.path.dirname(manifest_path)}' (chargement à la demande).")
+
+    def _replay_wal(self):
+        """Rejoue le journal des métadonnées écrit depuis la dernière compaction."""
+        if not os.path.exists(self._wal_path()):
+            return
+        count = 0
+        with open(self._wal_path(), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    continue  # Ligne incomplète (arrêt pendant une écriture)
+                self._apply(op)
+                count += 1
+        print(f"✅ {count} opération(s) rejouée(s) depuis '{self._wal_path()}'.")
+
+    def _load_legacy(self, path):
+        """
+        Découpe une base à index unique (`data.faiss`) en un shard par collection (sous `self.lock`).
+        Les shards sont écrits par `load()`, une fois le verrou relâché.
+        """
+        index = faiss.read_index(path)
+        self.metric = index.metric_type  # Un ancien index L2 reste utilisable tel quel
+        self.index_type = index_type_of(index)
+        self.index_params = {}
+        if self.index_type == "hnsw":
+            self.index_params = {"hnsw_m": faiss.downcast_index(index).hnsw.nb_neighbors(1)}
+        print(f"✅ Index FAISS chargé depuis '{path}'.")
+
+        ids, vectors = self._all_vectors(index)
+        keys = self.metadata.live_ids()
+        positional = np.array_equal(ids, np.arange(len(ids)))
+        if not isinstance(faiss.downcast_index(index), faiss.IndexIDMap) and positional and not np.array_equal(ids, keys):
+            # Les anciennes bases numérotaient les vecteurs par position (index.add), dans l'ordre des ids
+            if len(ids) != len(keys):
+                raise RuntimeError(
+                    f"❌ Index ({len(ids)} vecteurs) et métadonnées ({len(keys)}) désynchronisés : migration impossible."
+                )
+            ids = keys[ids]
+
+        self.shards = {}
+        for collection_name, collection_ids in self.collection_ids().items():
+            mask = np.isin(ids, collection_ids)
+            index = self.create_index(self.index_type, vectors[mask], ids=ids[mask], **self.index_params)
+            self.shards[collection_name] = FaissShard(
+                collection_name, self.dimension, path=self._shard_path(collection_name), index=index, mmap=self.mmap
+            )
 
     def display_collections(self):
         """
         Affiche les collections et le nombre de frames/embeddings dans chacune.
         """
-        if not self.metadata:
+        if not len(self.metadata):
             print("⚠️ Aucune collection disponible dans la base de données.")
             return
 
-        collections = {}
-        for metadata in self.metadata.values():
-            collection_name = metadata["collection"]
-            collections[collection_name] = collections.get(collection_name, 0) + 1
-
         print("🔍 Contenu de la base de données FAISS :")
-        for collection_name, count in collections.items():
-            print(f" - Collection : {collection_name}, Nombre de frames/embeddings : {count}")
+        for collection_name, stats in self.shard_stats().items():
+            state = "en mémoire" if stats["loaded"] else "sur disque"
+            print(f" - Collection : {collection_name}, Nombre de frames/embeddings : {stats['vectors']} ({state})")
 
     def reset_database(self, path):
         """
@@ -104,17 +760,23 @@ class FaissClient:
         """
         confirmation = input("⚠️ Êtes-vous sûr de vouloir réinitialiser la base de données ? (oui/non) : ")
         if confirmation.lower() == "oui":
-            self.index = faiss.IndexFlatL2(self.dimension)  # Réinitialiser l'index
-            self.metadata = {}  # Réinitialiser les métadonnées
-            self.next_id = 0  # Réinitialiser l'ID
-
-            # Supprimer les fichiers existants
-            faiss_path = path
-            metadata_path = path.replace(".faiss", "_metadata.json")
-            if os.path.exists(faiss_path):
-                os.remove(faiss_path)
-            if os.path.exists(metadata_path):
-                os.remove(metadata_path)
+            with self.lock:
+                for shard in self.shards.values():
+                    shard.release()
+                self.shards = {}  # Réinitialiser les shards
+                self.index_type = "flat"
+                self.index_params = {}
+                self.metadata = MetadataStore()  # Réinitialiser les métadonnées
+                self.next_id = 0  # Réinitialiser l'ID
+
+                # Supprimer les fichiers existants
+                self.path = path
+                self._wal = []
+                for file_path in (path, self._metadata_path(), self._legacy_metadata_path(), self._wal_path()):
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                if os.path.isdir(shards_dir(path)):
+                    shutil.rmtree(shards_dir(path))
 
             print("✅ Base de données FAISS réinitialisée et fichiers supprimés.")
         else:
@@ -123,19 +785,27 @@ class FaissClient:
     def delete_collection(self, collection_name):
         """
         Supprime une collection spécifique de la base de données FAISS.
+        Son shard est retiré en entier : les autres collections ne sont pas touchées.
         """
-        # Filtrer les IDs appartenant à la collection
-        ids_to_remove = [id for id, meta in self.metadata.items() if meta["collection"] == collection_name]
+        with self.lock:
+            if collection_name not in self.metadata.collection_counts():
+                print(f"⚠️ Aucune collection trouvée avec le nom '{collection_name}'.")
+                return
 
-        if not ids_to_remove:
-            print(f"⚠️ Aucune collection trouvée avec le nom '{collection_name}'.")
-            return
+            # Supprimer les métadonnées associées (journalisé tout de suite si la base est sur le disque)
+            op = {"op": "delete", "collection": collection_name}
+            self._apply(op)
+            self._wal.append(op)
+            if self.path and os.path.isdir(shards_dir(self.path)):
+                self._flush_wal()
 
-        # Supprimer les embeddings correspondants de l'index
-        self.index.remove_ids(np.array(ids_to_remove, dtype=np.int64))
+            # Supprimer le shard et ses fichiers
+            shard = self.shards.pop(collection_name, None)
+            if shard is not None:
+                shard.remove_files()
 
-        # Supprimer les métadonnées associées
-        for id in ids_to_remove:
-            del self.metadata[id]
+            print(f"✅ Collection '{collection_name}' supprimée avec succès.")
 
-        print(f"✅ Collection '{collection_name}' supprimée avec succès.")
\ No newline at end of file
+def index_memory_bytes(index):
+    """Taille sérialisée d'un index FAISS (approximation de sa mémoire)."""
+    return faiss.serialize_index(index).nbytes
\ No newline at end of file
@@ -0,0 +1,336 @@
+from imports import np, faiss, os
+import re
+import time
+import zlib
+
+# Lecture en mémoire projetée : listes inversées pour IVF, codes des index plats (Flat, HNSW) sinon
+MMAP_IVF_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+MMAP_FLAT_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def shard_file_name(collection):
+    """Nom de fichier (sans collision) du shard d'une collection."""
+    safe = re.sub(r"[^\w\-.]", "_", collection)[:64]
+    return f"{safe}_{zlib.crc32(collection.encode('utf-8')):08x}.faiss"
+
+
+def index_ids(index):
+    """Ids (non triés) de tous les vecteurs d'un index adressé par ids (IDMap ou IVF)."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        # Ancien index sans ids : les lignes sont numérotées par position
+        return np.arange(index.ntotal, dtype=np.int64)
+    invlists = ivf.invlists
+    lists = [
+        faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+        for l in range(ivf.nlist) if invlists.list_size(l)
+    ]
+    return np.concatenate(lists).astype(np.int64) if lists else np.empty(0, dtype=np.int64)
+
+
+def read_index_mmap(path):
+    """
+    Ouvre un index FAISS en mémoire projetée (lecture seule) : les pages sont lues à la demande
+    et partagées entre processus via le cache du système. Retourne None si c'est impossible.
+    """
+    with open(path, "rb") as f:
+        fourcc = f.read(4)
+    flags = MMAP_IVF_FLAGS if fourcc[:2] in (b"Iw", b"Iv") else MMAP_FLAT_FLAGS
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError as e:
+        print(f"⚠️ Lecture mmap impossible pour '{path}', lecture complète : {e}")
+        return None
+
+
+def replace_file(path, data):
+    """Écrit `data` dans `path` de façon atomique (fichier temporaire puis renommage)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def trim_file(path, length):
+    """Retire les `length` premiers octets d'un fichier en ajout seul (supprimé s'il devient vide)."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(length)
+        rest = f.read()
+    if rest:
+        replace_file(path, rest)
+    else:
+        os.remove(path)
+
+
+class FaissShard:
+    """
+    Index FAISS d'une seule collection (une caméra / une vidéo).
+    Sur le disque, un shard est un index de base (`.faiss`) suivi d'un segment en ajout seul
+    (`.seg`) : chaque sauvegarde n'y ajoute que les nouveaux vecteurs, et la compaction les
+    replie dans l'index de base.
+    Le shard n'est lu qu'au premier accès et peut être déchargé de la mémoire.
+    Avec `mmap=True`, l'index de base est projeté en mémoire en lecture seule ; les vecteurs du
+    segment et les nouveaux ajouts vont alors dans un petit index exact en mémoire (`delta`).
+    Avec `keep_raw=True` (index à perte comme IVF-PQ), les vecteurs d'origine sont aussi gardés
+    dans un fichier en ajout seul (`.raw`), jamais compacté : une reconstruction repart de ceux-ci.
+    """
+    def __init__(self, collection, dimension, path=None, index=None, mmap=False, keep_raw=False, raw=None):
+        self.collection = collection
+        self.dimension = dimension
+        self.record_dtype = np.dtype([("id", "<i8"), ("vector", "<f4", (dimension,))])
+        self.path = path  # Index de base (None tant que la base n'a jamais été sauvegardée)
+        self.index = index  # None : shard sur le disque, pas encore chargé
+        self.mmap = mmap
+        self.delta = None  # Index des vecteurs ajoutés à une base projetée (lecture seule)
+        self.dirty = index is not None  # L'index de base doit être réécrit (nouveau shard, index reconstruit)
+        self.version = 0  # Incrémenté à chaque réécriture complète de l'index en mémoire
+        self.pending = []  # Vecteurs ajoutés mais pas encore écrits dans le segment
+        self.keep_raw = keep_raw or raw is not None  # `raw` : (ids, vecteurs d'origine) d'un nouveau shard
+        self.raw_pending = [] if raw is None else [self._records(*raw)]  # Pas encore écrits dans le .raw
+        self.raw_reset = False  # Le fichier .raw doit être remplacé (et non complété) par raw_pending
+        self.last_used = time.monotonic()
+        self.bytes_per_vector = None  # Mesuré à la lecture / l'écriture du fichier
+
+    @property
+    def loaded(self):
+        return self.index is not None
+
+    @property
+    def mapped(self):
+        """Vrai si l'index de base est projeté en mémoire (et ne doit pas être modifié)."""
+        return self.delta is not None
+
+    @property
+    def segment_path(self):
+        return self.path[:-len(".faiss")] + ".seg" if self.path else None
+
+    @property
+    def raw_path(self):
+        return self.path[:-len(".faiss")] + ".raw" if self.path else None
+
+    def _records(self, ids, vectors):
+        records = np.empty(len(ids), dtype=self.record_dtype)
+        records["id"] = ids
+        records["vector"] = vectors
+        return records
+
+    def add(self, ids, vectors):
+        """Ajoute des vecteurs ; ils seront écrits dans le segment au prochain `flush()`."""
+        records = self._records(ids, vectors)
+        if self.index is not None:
+            (self.delta if self.mapped else self.index).add_with_ids(vectors, records["id"])
+        self.pending.append(records)
+        if self.keep_raw:
+            self.raw_pending.append(records)
+
+    def indexes(self):
+        """Index à interroger : la base, plus le delta s'il contient des vecteurs."""
+        if self.mapped and self.delta.ntotal:
+            return [self.index, self.delta]
+        return [self.index]
+
+    def rebuild(self, index, raw=None):
+        """
+        Remplace l'index en mémoire ; l'index de base devra être réécrit.
+        `raw` (ids, vecteurs d'origine) remplace le contenu du fichier .raw ; sans `raw`, il n'est plus tenu.
+        """
+        self.index = index
+        self.delta = None
+        self.dirty = True
+        self.version += 1
+        self.keep_raw = raw is not None
+        self.raw_reset = True
+        self.raw_pending = [] if raw is None else [self._records(*raw)]
+
+    def raw_vectors(self):
+        """
+        Vecteurs d'origine du shard (fichier .raw et ajouts pas encore écrits), None si le shard ne les garde pas.
+        Returns:
+            tuple: (ids croissants, np.ndarray (N, dimension) dans le même ordre).
+        """
+        if not self.keep_raw:
+            return None
+        parts = [] if self.raw_reset else [self._read_records(self.raw_path)]
+        records = np.concatenate(parts + self.raw_pending) if parts or self.raw_pending else np.empty(0, dtype=self.record_dtype)
+        # Un id réécrit après un arrêt brutal : le dernier enregistrement fait foi
+        _, last = np.unique(records["id"][::-1], return_index=True)
+        records = records[len(records) - 1 - last]
+        return records["id"].copy(), np.ascontiguousarray(records["vector"])
+
+    def flush_raw(self):
+        """Écrit les vecteurs d'origine en attente dans le fichier .raw (appelé sous le verrou du client)."""
+        if self.raw_reset:
+            if self.raw_path and os.path.exists(self.raw_path):
+                os.remove(self.raw_path)
+            self.raw_reset = False
+        if not self.raw_pending:
+            return 0
+        records = np.concatenate(self.raw_pending)
+        size = os.path.getsize(self.raw_path) if os.path.exists(self.raw_path) else 0
+        if size % self.record_dtype.itemsize:
+            os.truncate(self.raw_path, size - size % self.record_dtype.itemsize)  # Enregistrement incomplet
+        with open(self.raw_path, "ab") as f:
+            f.write(records.tobytes())
+        self.raw_pending = []
+        return records.nbytes
+
+    def flush(self):
+        """Ajoute les vecteurs en attente à la fin du segment. Retourne le nombre d'octets écrits."""
+        written = self.flush_raw()
+        if not self.pending:
+            return written
+        records = np.concatenate(self.pending)
+        size = self.segment_bytes()
+        if size % self.record_dtype.itemsize:
+            # Enregistrement incomplet laissé par un arrêt brutal : le retirer pour rester aligné
+            os.truncate(self.segment_path, size - size % self.record_dtype.itemsize)
+        with open(self.segment_path, "ab") as f:
+            f.write(records.tobytes())
+        self.pending = []
+        return written + records.nbytes
+
+    def segment_bytes(self):
+        path = self.segment_path
+        return os.path.getsize(path) if path and os.path.exists(path) else 0
+
+    def base_bytes(self):
+        return os.path.getsize(self.path) if self.path and os.path.exists(self.path) else 0
+
+    def load(self):
+        """Lit l'index de base puis rejoue le segment et les vecteurs en attente."""
+        start = time.perf_counter()
+        index = read_index_mmap(self.path) if self.mmap else None
+        mapped = index is not None
+        if index is None:
+            index = faiss.read_index(self.path)
+        ids = index_ids(index)
+        last_id = ids.max() if len(ids) else -1
+
+        records = self._read_segment()
+        if self.pending:
+            records = np.concatenate([records] + self.pending)
+        # Un segment déjà replié dans la base (arrêt pendant une compaction) est ignoré :
+        # les ids d'une collection sont croissants
+        records = records[records["id"] > last_id]
+        self.delta = faiss.IndexIDMap2(faiss.IndexFlat(self.dimension, index.metric_type)) if mapped else None
+        if len(records):
+            (self.delta if mapped else index).add_with_ids(np.ascontiguousarray(records["vector"]), records["id"])
+
+        self.index = index
+        self.dirty = False
+        self._measure()
+        print(
+            f"📂 Shard '{self.collection}' {'projeté' if mapped else 'chargé'} ({index.ntotal + len(records) * mapped} vecteurs "
+            f"dont {len(records)} du segment, {(time.perf_counter() - start) * 1000:.0f} ms)."
+        )
+        return self.index
+
+    def snapshot(self):
+        """
+        Fige l'état à compacter (à appeler sous le verrou du client).
+        Returns:
+            tuple: (fonction qui écrit le nouvel index de base dans un fichier temporaire,
+                    taille du segment qu'il contient déjà, version de l'index).
+        """
+        tmp_path = self.path + ".tmp"
+        self.flush_raw()  # Les vecteurs figés ne passeront pas par le segment
+        if self.mapped:
+            # Base projetée : relire le fichier en mémoire et y ajouter le delta, hors verrou
+            delta = None
+            if self.delta.ntotal:
+                delta = (index_ids(self.delta), self.delta.index.reconstruct_n(0, self.delta.ntotal))
+            base_path = self.path
+
+            def write():
+                index = faiss.read_index(base_path)
+                if delta is not None:
+                    index.add_with_ids(delta[1], delta[0])
+                faiss.write_index(index, tmp_path)
+        else:
+            data = faiss.serialize_index(self.index)
+
+            def write():
+                with open(tmp_path, "wb") as f:
+                    f.write(data.tobytes())
+        self.pending = []  # Déjà dans l'index figé
+        return write, self.segment_bytes(), self.version
+
+    def install_base(self, version):
+        """
+        Remplace l'index de base par le fichier écrit par `snapshot()` (sous le verrou du client).
+        Si l'index n'a pas été reconstruit depuis (`version`), le shard redevient propre ; en mode
+        mmap il est libéré pour être reprojeté depuis la nouvelle base au prochain accès.
+        """
+        current = self.version == version
+        if current and self.mmap:
+            self.release()  # Un fichier projeté ne peut pas être remplacé sous Windows
+        os.replace(self.path + ".tmp", self.path)
+        if current:
+            self.dirty = False
+        return current
+
+    def to_memory(self):
+        """Remplace une base projetée par une copie modifiable en mémoire (base relue + delta)."""
+        if not self.mapped:
+            return
+        index = faiss.read_index(self.path)
+        if self.delta.ntotal:
+            index.add_with_ids(self.delta.index.reconstruct_n(0, self.delta.ntotal), index_ids(self.delta))
+        self.index = index
+        self.delta = None
+
+    def trim_segment(self, length):
+        """Retire du segment les `length` premiers octets, repliés dans l'index de base."""
+        trim_file(self.segment_path, length)
+
+    def remove_files(self):
+        self.release()  # Un fichier projeté ne peut pas être supprimé sous Windows
+        for path in (self.path, self.segment_path, self.raw_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def evict(self):
+        """Libère l'index de la mémoire ; il sera relu au prochain accès."""
+        if self.dirty:
+            raise RuntimeError(f"❌ Le shard '{self.collection}' a des modifications non sauvegardées.")
+        self.release()
+        print(f"🗑️ Shard '{self.collection}' déchargé de la mémoire.")
+
+    def release(self):
+        """Libère l'index (et sa projection) ; les vecteurs en attente sont conservés."""
+        self.index = None
+        self.delta = None
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def memory_bytes(self, dimension):
+        """Mémoire estimée de l'index chargé (0 si le shard n'est pas en mémoire)."""
+        if self.index is None:
+            return 0
+        if self.mapped:
+            # Les pages projetées appartiennent au cache du système : seuls comptent les ids et le delta
+            return int(self.index.ntotal * 16 + self.delta.ntotal * (dimension * 4 + 16))
+        bytes_per_vector = self.bytes_per_vector or dimension * 4 + 16  # Flat + table des ids
+        return int(self.index.ntotal * bytes_per_vector)
+
+    def _read_segment(self):
+        return self._read_records(self.segment_path)
+
+    def _read_records(self, path):
+        if not path or not os.path.exists(path):
+            return np.empty(0, dtype=self.record_dtype)
+        with open(path, "rb") as f:
+            data = f.read()
+        # Un dernier enregistrement incomplet (arrêt pendant une écriture) est ignoré
+        usable = len(data) - len(data) % self.record_dtype.itemsize
+        return np.frombuffer(data[:usable], dtype=self.record_dtype)
+
+    def _measure(self):
+        if self.path and os.path.exists(self.path) and self.index.ntotal:
+            self.bytes_per_vector = (self.base_bytes() + self.segment_bytes()) / self.index.ntotal
\ No newline at end of file
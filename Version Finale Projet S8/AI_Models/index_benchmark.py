@@ -0,0 +1,74 @@
+from imports import np, faiss
+from AI_Models.faissClient import index_memory_bytes, index_type_of
+import time
+
+
+def _timed_search(index, queries, k, params=None):
+    start = time.perf_counter()
+    _, indices = index.search(queries, k, params=params)
+    latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return indices, latency_ms
+
+
+def _recall(indices, truth, k):
+    """Recall@k : part des k vrais plus proches voisins retrouvés par l'index approché."""
+    hits = sum(len(np.intersect1d(found[found >= 0], expected[expected >= 0])) for found, expected in zip(indices, truth))
+    return hits / (len(truth) * k)
+
+
+def recall_latency_report(client, queries, k=10, index_types=("hnsw", "ivf", "ivfpq"),
+                          nprobes=(1, 4, 16, 64), ef_searches=(16, 64, 256), **build_params):
+    """
+    Compare les index approchés à la recherche exacte sur les vecteurs actuels du client
+    (leurs valeurs d'origine, même si le client est en IVF-PQ : voir FaissClient.get_embeddings).
+    Pour chaque type d'index et chaque réglage (nprobe pour IVF, efSearch pour HNSW), mesure
+    la latence moyenne par requête, le recall@k par rapport à l'index exact et la mémoire.
+    Le client n'est pas modifié ; les index candidats sont construits à part.
+    Chaque ligne porte le type d'index réellement construit : un "ivfpq" construit en IVF
+    (trop peu de vecteurs pour PQ) n'est pas mesuré une seconde fois sous le nom "ivf".
+    Args:
+        client (FaissClient): Client dont les vecteurs servent de base de test.
+        queries (np.ndarray): Requêtes (Q, dimension), par exemple des embeddings de prompts.
+        build_params: Paramètres transmis à FaissClient.create_index (nlist, hnsw_m, pq_m...).
+    Returns:
+        list[dict]: Une ligne par configuration testée.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, client.dimension)
+    _, vectors = client.get_embeddings()
+    k = min(k, len(vectors))
+    if k == 0:
+        print("⚠️ Aucun vecteur dans la base : rapport impossible.")
+        return []
+
+    # Référence : recherche exacte
+    flat = client.create_index("flat", vectors)
+    truth, flat_latency = _timed_search(flat, queries, k)
+    report = [{
+        "index_type": "flat", "setting": "-", "latency_ms": flat_latency,
+        "recall": 1.0, "memory_mb": index_memory_bytes(flat) / 2**20,
+    }]
+
+    measured = set()
+    for requested_type in index_types:
+        index = client.create_index(requested_type, vectors, **build_params)
+        index_type = index_type_of(index)
+        if index_type in measured:
+            print(f"⚠️ '{requested_type}' construit comme '{index_type}', déjà mesuré : ignoré.")
+            continue
+        measured.add(index_type)
+        if index_type == "hnsw":
+            settings = [("efSearch", ef, faiss.SearchParametersHNSW(efSearch=ef)) for ef in ef_searches]
+        else:
+            settings = [("nprobe", nprobe, faiss.SearchParametersIVF(nprobe=nprobe)) for nprobe in nprobes]
+        for knob, value, params in settings:
+            indices, latency = _timed_search(index, queries, k, params=params)
+            report.append({
+                "index_type": index_type, "setting": f"{knob}={value}", "latency_ms": latency,
+                "recall": _recall(indices, truth, k), "memory_mb": index_memory_bytes(index) / 2**20,
+            })
+
+    print(f"📊 Recall@{k} / latence ({len(vectors)} vecteurs, {len(queries)} requêtes) :")
+    print(f"{'Index':<8}{'Réglage':<14}{'Latence (ms)':<14}{'Recall':<10}{'Mémoire (Mo)':<12}")
+    for row in report:
+        print(f"{row['index_type']:<8}{row['setting']:<14}{row['latency_ms']:<14.3f}{row['recall']:<10.3f}{row['memory_mb']:<12.1f}")
+    return report
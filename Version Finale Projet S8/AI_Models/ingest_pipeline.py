@@ -0,0 +1,261 @@
+from imports import np, os, cv2
+import queue
+import threading
+import time
+
+_END = object()  # Marqueur de fin de flux entre deux étages
+
+
+class IngestCancelled(Exception):
+    """Levée par IngestPipeline.run lorsque l'ingestion a été annulée."""
+
+
+class StageStats:
+    """
+    Statistiques d'un étage du pipeline : nombre d'éléments traités, temps actif
+    et profondeur de sa file (file d'entrée, ou de sortie pour le décodeur).
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_time = 0.0
+        self.start_time = None
+        self.end_time = None
+        self.queue_samples = 0
+        self.queue_depth_sum = 0
+        self.queue_depth_max = 0
+
+    def started(self):
+        self.start_time = time.perf_counter()
+
+    def stopped(self):
+        self.end_time = time.perf_counter()
+
+    def sample_queue(self, depth):
+        self.queue_samples += 1
+        self.queue_depth_sum += depth
+        self.queue_depth_max = max(self.queue_depth_max, depth)
+
+    def as_dict(self):
+        elapsed = (self.end_time or time.perf_counter()) - (self.start_time or time.perf_counter())
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "elapsed_seconds": round(elapsed, 3),
+            "busy_seconds": round(self.busy_time, 3),
+            "items_per_second": round(self.items / elapsed, 2) if elapsed > 0 else 0.0,
+            "avg_queue_depth": round(self.queue_depth_sum / self.queue_samples, 2) if self.queue_samples else 0.0,
+            "max_queue_depth": self.queue_depth_max,
+        }
+
+
+class IngestPipeline:
+    """
+    Pipeline d'ingestion en trois étages reliés par des files bornées :
+      1. lecture  : thread qui décode la vidéo (cv2.VideoCapture) en sautant les frames
+                    non retenues avec `grab()` ;
+      2. encodage : encodage CLIP par batch, exécuté dans le thread appelant ;
+      3. écriture : thread qui écrit les miniatures et accumule ids / embeddings.
+    Les files bornées assurent la contre-pression : un étage trop rapide se bloque
+    au lieu d'accumuler des frames en mémoire.
+    """
+    def __init__(self, video_path, comparator, frames_dir=None, target_fps=2, batch_size=16, queue_size=None,
+                 progress_callback=None, cancel_event=None):
+        self.video_path = video_path
+        self.comparator = comparator
+        self.frames_dir = frames_dir  # None : pas d'écriture des miniatures
+        self.target_fps = target_fps
+        self.batch_size = batch_size
+        queue_size = queue_size or batch_size * 4
+        self.decode_queue = queue.Queue(maxsize=queue_size)  # frames décodées -> encodeur
+        self.write_queue = queue.Queue(maxsize=max(2, queue_size // batch_size))  # batches encodés -> écrivain
+        self.progress_callback = progress_callback  # appelé avec le nombre de frames écrites
+        self.stop_event = cancel_event or threading.Event()  # partagé avec l'appelant pour annuler
+        self.errors = []
+        self.stats = {name: StageStats(name) for name in ("decode", "encode", "write")}
+        self.source_fps = 0.0
+        self.source_frames = 0
+
+        # Résultats assemblés par l'étage d'écriture
+        self.ids = []
+        self.frame_indices = []
+        self.timestamps = []
+        self.embeddings = []
+
+    def run(self):
+        """
+        Exécute le pipeline complet et retourne les résultats.
+        Returns:
+            dict: ids, frame_indices, timestamps et embeddings (np.ndarray).
+        """
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            raise RuntimeError(f"❌ Unable to open video: {self.video_path}")
+
+        reader = threading.Thread(target=self._guard, args=(self._decode, cap), daemon=True)
+        writer = threading.Thread(target=self._guard, args=(self._write,), daemon=True)
+        reader.start()
+        writer.start()
+        try:
+            self._guard(self._encode)
+        finally:
+            reader.join()
+            writer.join()
+            cap.release()
+
+        if self.errors:
+            raise self.errors[0]
+        if self.stop_event.is_set():
+            raise IngestCancelled(f"Ingestion annulée : {self.video_path}")
+
+        embeddings = np.concatenate(self.embeddings) if self.embeddings else np.empty((0, 0), dtype=np.float32)
+        return {
+            "ids": self.ids,
+            "frame_indices": self.frame_indices,
+            "timestamps": self.timestamps,
+            "embeddings": embeddings,
+        }
+
+    def cancel(self):
+        """Demande l'arrêt de tous les étages ; run() lèvera IngestCancelled."""
+        self.stop_event.set()
+
+    def report(self):
+        """Affiche et retourne le débit et la profondeur de file de chaque étage."""
+        report = [stats.as_dict() for stats in self.stats.values()]
+        print("📊 Pipeline d'ingestion :")
+        for stage in report:
+            print(
+                f" - {stage['stage']:<7} {stage['items']:>7} frames, {stage['items_per_second']:>8} frames/s, "
+                f"actif {stage['busy_seconds']}s / {stage['elapsed_seconds']}s, "
+                f"file moy. {stage['avg_queue_depth']} (max {stage['max_queue_depth']})"
+            )
+        return report
+
+    # --- Étages ---
+
+    def _decode(self, cap):
+        stats = self.stats["decode"]
+        stats.started()
+        self.source_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        if self.source_fps > 0 and self.target_fps and self.target_fps < self.source_fps:
+            sample_interval = self.source_fps / self.target_fps
+        else:
+            sample_interval = 1.0
+
+        frame_index = 0
+        next_sample = 0.0
+        try:
+            while not self.stop_event.is_set():
+                t0 = time.perf_counter()
+                if frame_index < next_sample:
+                    # Frame ignorée : avancer le décodeur sans récupérer l'image
+                    if not cap.grab():
+                        break
+                    frame_index += 1
+                    stats.busy_time += time.perf_counter() - t0
+                    continue
+
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if self.source_fps > 0:
+                    timestamp = frame_index / self.source_fps
+                else:
+                    timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                stats.busy_time += time.perf_counter() - t0
+                stats.items += 1
+
+                stats.sample_queue(self.decode_queue.qsize())
+                self._put(self.decode_queue, (frame_index, timestamp, frame))
+                frame_index += 1
+                next_sample += sample_interval
+        finally:
+            self.source_frames = frame_index
+            self._put(self.decode_queue, _END)
+            stats.stopped()
+
+    def _encode(self):
+        stats = self.stats["encode"]
+        stats.started()
+        batch = []
+        try:
+            while True:
+                stats.sample_queue(self.decode_queue.qsize())
+                item = self._get(self.decode_queue)
+                if item is _END:
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._encode_batch(batch, stats)
+                    batch = []
+            if batch and not self.stop_event.is_set():
+                self._encode_batch(batch, stats)
+        finally:
+            self._put(self.write_queue, _END)
+            stats.stopped()
+
+    def _encode_batch(self, batch, stats):
+        t0 = time.perf_counter()
+        frames = [frame for _, _, frame in batch]
+        embeddings = self.comparator.encode_images(frames, batch_size=self.batch_size, bgr=True)
+        stats.busy_time += time.perf_counter() - t0
+        stats.items += len(batch)
+        self._put(self.write_queue, (batch, embeddings))
+
+    def _write(self):
+        stats = self.stats["write"]
+        stats.started()
+        try:
+            while True:
+                stats.sample_queue(self.write_queue.qsize())
+                item = self._get(self.write_queue)
+                if item is _END:
+                    break
+                batch, embeddings = item
+                t0 = time.perf_counter()
+                for frame_index, timestamp, frame in batch:
+                    frame_file_name = f"frame_{frame_index:06d}.jpg"
+                    if self.frames_dir:
+                        cv2.imwrite(os.path.join(self.frames_dir, frame_file_name), frame)
+                    self.ids.append(frame_file_name)
+                    self.frame_indices.append(frame_index)
+                    self.timestamps.append(timestamp)
+                self.embeddings.append(embeddings)
+                stats.busy_time += time.perf_counter() - t0
+                stats.items += len(batch)
+                if self.progress_callback:
+                    self.progress_callback(len(self.ids))
+        finally:
+            stats.stopped()
+
+    # --- Outils ---
+
+    def _guard(self, target, *args):
+        """Exécute un étage ; en cas d'erreur, mémorise l'exception et arrête le pipeline."""
+        try:
+            target(*args)
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+
+    def _get(self, q):
+        """Lit un élément d'une file ; retourne le marqueur de fin si le pipeline est arrêté."""
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _put(self, q, item):
+        """
+        Ajoute un élément à une file bornée (bloque tant qu'elle est pleine).
+        Abandonne si le pipeline est arrêté : les consommateurs sortent alors d'eux-mêmes.
+        """
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
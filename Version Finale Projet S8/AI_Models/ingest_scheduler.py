@@ -0,0 +1,156 @@
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+import itertools
+import queue
+import threading
+
+
+class IngestJob:
+    """Une vidéo en attente (ou en cours) d'ingestion."""
+    def __init__(self, video_path, bank_path, priority=0, target_fps=2, batch_size=16, save_frames=True):
+        self.video_path = video_path
+        self.bank_path = bank_path
+        self.priority = priority
+        self.target_fps = target_fps
+        self.batch_size = batch_size
+        self.save_frames = save_frames
+        self.cancel_event = threading.Event()
+        self.status = "pending"  # pending, running, finished, failed, cancelled
+
+
+class IngestWorker(QThread):
+    """Thread qui dépile les vidéos de l'ordonnanceur et les ingère une par une."""
+    def __init__(self, scheduler):
+        super().__init__()
+        self.scheduler = scheduler
+
+    def run(self):
+        while not self.scheduler.stop_event.is_set():
+            try:
+                _, _, job = self.scheduler.jobs.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            self.scheduler._run_job(job)
+            self.scheduler.jobs.task_done()
+
+
+class IngestScheduler(QObject):
+    """
+    Ordonnanceur d'ingestion : une file de vidéos à priorité, servie par `max_concurrent`
+    threads qui partagent un seul modèle CLIP.
+    Les jobs de priorité la plus élevée passent en premier ; à priorité égale, l'ordre
+    de soumission est conservé.
+    """
+    job_started = pyqtSignal(str)  # video_path
+    job_progress = pyqtSignal(str, int)  # video_path, frames encodées
+    job_finished = pyqtSignal(str, str)  # video_path, message
+    job_failed = pyqtSignal(str, str)  # video_path, message d'erreur
+    job_cancelled = pyqtSignal(str)  # video_path
+    all_finished = pyqtSignal(int, int, int)  # Jobs réussis, échoués, annulés depuis que la file était vide
+
+    def __init__(self, client, max_concurrent=2):
+        super().__init__()
+        self.client = client
+        self.max_concurrent = max_concurrent
+        self.jobs = queue.PriorityQueue()
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.active = {}  # video_path -> IngestJob (en attente ou en cours)
+        self._counter = itertools.count()
+        self.workers = []
+        self.outcomes = {"finished": 0, "failed": 0, "cancelled": 0}  # Bilan de la série de jobs en cours
+
+    @property
+    def comparator(self):
+        """Modèle CLIP partagé par tous les jobs (registre de modèles du processus)."""
+        from AI_Models.Clip_Analysis import get_comparator
+        return get_comparator()
+
+    def submit(self, video_path, bank_path, priority=0, **options):
+        """
+        Ajoute une vidéo à la file d'ingestion.
+        Args:
+            priority (int): Plus la valeur est grande, plus la vidéo passe tôt.
+            options: target_fps, batch_size, save_frames (voir process_upload).
+        Returns:
+            IngestJob: Le job créé.
+        """
+        job = IngestJob(video_path, bank_path, priority=priority, **options)
+        with self.lock:
+            self.active[video_path] = job
+        self.jobs.put((-priority, next(self._counter), job))
+        self._ensure_workers()
+        print(f"📥 Vidéo ajoutée à la file d'ingestion : {video_path} (priorité {priority})")
+        return job
+
+    def cancel(self, video_path):
+        """Annule un job en attente ou interrompt un job en cours."""
+        with self.lock:
+            job = self.active.get(video_path)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def cancel_all(self):
+        with self.lock:
+            jobs = list(self.active.values())
+        for job in jobs:
+            job.cancel_event.set()
+
+    def pending_count(self):
+        """Nombre de vidéos en attente ou en cours d'ingestion."""
+        with self.lock:
+            return len(self.active)
+
+    def shutdown(self):
+        """Annule les jobs restants et attend l'arrêt des threads."""
+        self.cancel_all()
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.wait()
+        self.workers.clear()
+
+    def _ensure_workers(self):
+        self.workers = [worker for worker in self.workers if worker.isRunning()]
+        while len(self.workers) < self.max_concurrent:
+            worker = IngestWorker(self)
+            self.workers.append(worker)
+            worker.start()
+
+    def _run_job(self, job):
+        from upload import process_upload
+        from AI_Models.ingest_pipeline import IngestCancelled
+
+        try:
+            if job.cancel_event.is_set():
+                raise IngestCancelled()
+            job.status = "running"
+            self.job_started.emit(job.video_path)
+            message = process_upload(
+                job.video_path, job.bank_path, self.client,
+                target_fps=job.target_fps, batch_size=job.batch_size, save_frames=job.save_frames,
+                comparator=self.comparator,
+                progress_callback=lambda count: self.job_progress.emit(job.video_path, count),
+                cancel_event=job.cancel_event,
+            )
+            job.status = "finished"
+            self.job_finished.emit(job.video_path, message)
+        except IngestCancelled:
+            job.status = "cancelled"
+            print(f"🛑 Ingestion annulée : {job.video_path}")
+            self.job_cancelled.emit(job.video_path)
+        except Exception as e:
+            job.status = "failed"
+            self.job_failed.emit(job.video_path, f"❌ Error during upload: {e}")
+        finally:
+            with self.lock:
+                if self.active.get(job.video_path) is job:
+                    del self.active[job.video_path]
+                self.outcomes[job.status] = self.outcomes.get(job.status, 0) + 1
+                outcomes = None
+                if not self.active:
+                    outcomes = self.outcomes
+                    self.outcomes = {"finished": 0, "failed": 0, "cancelled": 0}
+            # Pas de bilan pendant l'arrêt de l'application : les jobs y sont annulés d'office
+            if outcomes is not None and not self.stop_event.is_set():
+                self.all_finished.emit(outcomes["finished"], outcomes["failed"], outcomes["cancelled"])
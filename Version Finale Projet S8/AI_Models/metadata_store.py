@@ -0,0 +1,280 @@
+from imports import np, os, json
+
+
+class MetadataStore:
+    """
+    Métadonnées des frames en colonnes (une ligne par embedding) :
+      - collection : code int32 dans la table des noms de collection ;
+      - frame_index (int32, -1 si inconnu) et timestamp (float64, NaN si inconnu) ;
+      - nom de la frame : table de chaînes (octets UTF-8 concaténés + positions de fin).
+    Un tableau id -> ligne donne l'accès en O(1) ; le filtrage par collection ou par
+    intervalle de temps est une opération vectorielle sur les colonnes.
+    Un index inversé collection -> ids est tenu à jour à chaque ajout / suppression : lister,
+    compter ou supprimer une collection ne parcourt que ses propres frames.
+    Les lignes supprimées sont marquées (collection = -1) puis retirées à la sauvegarde.
+    """
+    COLUMNS = ("ids", "collection", "frame_index", "timestamp", "name_end")
+
+    def __init__(self):
+        self.collections = []  # Table des noms de collection : code -> nom
+        self._codes = {}  # nom -> code
+        self.size = 0  # Lignes utilisées (y compris les lignes supprimées)
+        self.live = 0  # Lignes non supprimées
+        self.ids = np.empty(0, dtype=np.int64)
+        self.collection = np.empty(0, dtype=np.int32)
+        self.frame_index = np.empty(0, dtype=np.int32)
+        self.timestamp = np.empty(0, dtype=np.float64)
+        self.name_end = np.empty(0, dtype=np.int64)  # Fin (exclue) du nom de chaque ligne dans `names`
+        self.names = np.empty(0, dtype=np.uint8)
+        self.names_size = 0
+        self.row_of = np.empty(0, dtype=np.int32)  # id -> ligne (-1 : id absent)
+        self._members = {}  # Index inversé : collection -> [ids croissants (tableau surdimensionné), nombre d'ids]
+
+    def __len__(self):
+        return self.live
+
+    def __iter__(self):
+        return iter(self.live_ids().tolist())
+
+    def __contains__(self, id):
+        return 0 <= id < len(self.row_of) and self.row_of[id] >= 0
+
+    def __getitem__(self, id):
+        meta = self.get(id)
+        if meta is None:
+            raise KeyError(id)
+        return meta
+
+    def get(self, id, default=None):
+        """Métadonnées d'un id sous forme de dict ({"collection", "name", "frame_index", "timestamp"})."""
+        id = int(id)
+        if id not in self:
+            return default
+        return self._row_dict(self.row_of[id])
+
+    def max_id(self):
+        """Plus grand id présent (-1 si la base est vide)."""
+        rows = self.row_of >= 0
+        return int(np.flatnonzero(rows)[-1]) if rows.any() else -1
+
+    def code(self, collection_name):
+        """Code d'une collection (créé au besoin)."""
+        code = self._codes.get(collection_name)
+        if code is None:
+            code = len(self.collections)
+            self.collections.append(collection_name)
+            self._codes[collection_name] = code
+        return code
+
+    def append(self, collection_name, first_id, names, frame_indices=None, timestamps=None):
+        """Ajoute les frames `first_id`, `first_id + 1`... d'une collection. Les ids déjà présents sont ignorés."""
+        n = len(names)
+        if n == 0:
+            return
+        ids = np.arange(first_id, first_id + n, dtype=np.int64)
+        known = ids < len(self.row_of)
+        present = np.zeros(n, dtype=bool)
+        present[known] = self.row_of[ids[known]] >= 0
+        if present.any():
+            # Rejeu du journal sur une sauvegarde qui contient déjà une partie des ids
+            keep = ~present
+            ids = ids[keep]
+            names = [name for name, kept in zip(names, keep) if kept]
+            frame_indices = np.asarray(frame_indices)[keep] if frame_indices is not None else None
+            timestamps = np.asarray(timestamps)[keep] if timestamps is not None else None
+            n = len(ids)
+            if n == 0:
+                return
+
+        encoded = [name.encode("utf-8") for name in names]
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        ends = self.names_size + np.cumsum([len(name) for name in encoded], dtype=np.int64)
+
+        self._reserve(self.size + n, self.names_size + len(blob), int(ids[-1]) + 1)
+        rows = slice(self.size, self.size + n)
+        self.ids[rows] = ids
+        self.collection[rows] = self.code(collection_name)
+        self.frame_index[rows] = frame_indices if frame_indices is not None else -1
+        self.timestamp[rows] = timestamps if timestamps is not None else np.nan
+        self.name_end[rows] = ends
+        self.names[self.names_size:self.names_size + len(blob)] = blob
+        self.row_of[ids] = np.arange(self.size, self.size + n, dtype=np.int32)
+        self.size += n
+        self.names_size += len(blob)
+        self.live += n
+        self._add_members(collection_name, ids)
+
+    def delete_collection(self, collection_name):
+        """Supprime les lignes d'une collection. Retourne leurs ids."""
+        entry = self._members.pop(collection_name, None)
+        if entry is None:
+            return np.empty(0, dtype=np.int64)
+        ids = entry[0][:entry[1]]
+        self.collection[self.row_of[ids]] = -1
+        self.row_of[ids] = -1
+        self.live -= len(ids)
+        return ids
+
+    def live_ids(self):
+        """Ids présents, triés."""
+        return np.sort(self.ids[:self.size][self.collection[:self.size] >= 0])
+
+    def collection_ids(self):
+        """{collection: ids triés de ses frames}, lu directement dans l'index inversé."""
+        return {name: ids[:count] for name, (ids, count) in self._members.items()}
+
+    def collection_counts(self):
+        """{collection: nombre de frames}."""
+        return {name: count for name, (_, count) in self._members.items()}
+
+    def ids_in_time_range(self, time_range, collections=None):
+        """
+        Ids des frames dont le timestamp (secondes dans la vidéo) est dans [t0, t1], bornes incluses.
+        Une borne à None n'est pas limitée ; les frames sans timestamp sont exclues.
+        Seules les frames des collections demandées (toutes par défaut) sont examinées.
+        Returns:
+            dict: {collection: ids croissants}, sans les collections qui n'ont aucune frame retenue.
+        """
+        t0, t1 = time_range
+        t0 = -np.inf if t0 is None else float(t0)
+        t1 = np.inf if t1 is None else float(t1)
+        names = self._members if collections is None else [name for name in collections if name in self._members]
+        selected = {}
+        for name in names:
+            ids, count = self._members[name]
+            ids = ids[:count]
+            timestamps = self.timestamp[self.row_of[ids]]
+            ids = ids[(timestamps >= t0) & (timestamps <= t1)]
+            if len(ids):
+                selected[name] = ids
+        return selected
+
+    def columns(self, ids):
+        """
+        Colonnes de plusieurs ids d'un coup (ids absents exclus).
+        Returns:
+            dict: ids, collection (noms), frame_index, timestamp, name.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids < len(self.row_of))]
+        rows = self.row_of[ids]
+        ids, rows = ids[rows >= 0], rows[rows >= 0]
+        return {
+            "ids": ids,
+            "collection": [self.collections[code] for code in self.collection[rows]],
+            "frame_index": self.frame_index[rows],
+            "timestamp": self.timestamp[rows],
+            "name": [self._name(row) for row in rows],
+        }
+
+    # --- Persistance ---
+
+    def snapshot(self):
+        """Copie compacte (sans lignes supprimées) des colonnes, prête à être écrite hors verrou."""
+        rows = np.flatnonzero(self.collection[:self.size] >= 0)
+        starts = np.concatenate(([0], self.name_end[:self.size][:-1]))[rows]
+        lengths = self.name_end[rows] - starts
+        # Positions des octets des noms conservés, sans boucle Python
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        names = self.names[offsets + np.arange(lengths.sum())]
+        return {
+            "ids": self.ids[rows],
+            "collection": self.collection[rows],
+            "frame_index": self.frame_index[rows],
+            "timestamp": self.timestamp[rows],
+            "name_end": np.cumsum(lengths, dtype=np.int64),
+            "names": names,
+            "collections": np.array(self.collections, dtype=str),
+        }
+
+    @staticmethod
+    def write(path, snapshot):
+        """Écrit un instantané (voir `snapshot`) dans un fichier .npz, de façon atomique."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **snapshot)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        store = cls()
+        with np.load(path, allow_pickle=False) as data:
+            store.collections = [str(name) for name in data["collections"]]
+            store._codes = {name: code for code, name in enumerate(store.collections)}
+            for column in cls.COLUMNS:
+                setattr(store, column, data[column].copy())
+            store.names = data["names"].copy()
+        store.size = store.live = len(store.ids)
+        store.names_size = len(store.names)
+        store.row_of = np.full(int(store.ids.max()) + 1 if store.size else 0, -1, dtype=np.int32)
+        store.row_of[store.ids] = np.arange(store.size, dtype=np.int32)
+        # Reconstruire l'index inversé en un seul tri
+        order = np.lexsort((store.ids, store.collection))
+        present, starts = np.unique(store.collection[order], return_index=True)
+        for code, ids in zip(present, np.split(store.ids[order], starts[1:])):
+            store._members[store.collections[code]] = [ids, len(ids)]
+        return store
+
+    @classmethod
+    def from_json(cls, path):
+        """Convertit l'ancien fichier `_metadata.json` ({id: {"collection", "name", ...}})."""
+        with open(path, "r") as f:
+            metadata = json.load(f)
+        store = cls()
+        items = sorted(((int(k), v) for k, v in metadata.items()), key=lambda item: item[0])
+        # Regrouper les ids consécutifs d'une même collection pour des ajouts vectorisés
+        start = 0
+        for i in range(1, len(items) + 1):
+            if i == len(items) or items[i][1]["collection"] != items[start][1]["collection"] or items[i][0] != items[i - 1][0] + 1:
+                group = [meta for _, meta in items[start:i]]
+                store.append(
+                    group[0]["collection"], items[start][0], [meta["name"] for meta in group],
+                    frame_indices=[meta.get("frame_index", -1) for meta in group],
+                    timestamps=[meta.get("timestamp", np.nan) for meta in group],
+                )
+                start = i
+        return store
+
+    # --- Outils ---
+
+    def _row_dict(self, row):
+        meta = {"collection": self.collections[self.collection[row]], "name": self._name(row)}
+        if self.frame_index[row] >= 0:
+            meta["frame_index"] = int(self.frame_index[row])
+        if not np.isnan(self.timestamp[row]):
+            meta["timestamp"] = float(self.timestamp[row])
+        return meta
+
+    def _name(self, row):
+        start = self.name_end[row - 1] if row > 0 else 0
+        return self.names[start:self.name_end[row]].tobytes().decode("utf-8")
+
+    def _add_members(self, collection_name, ids):
+        entry = self._members.setdefault(collection_name, [np.empty(0, dtype=np.int64), 0])
+        members, count = entry
+        if count + len(ids) > len(members):
+            grown = np.empty(max(count + len(ids), 2 * len(members), 64), dtype=np.int64)
+            grown[:count] = members[:count]
+            entry[0] = members = grown
+        members[count:count + len(ids)] = ids
+        if count and ids[0] < members[count - 1]:
+            members[:count + len(ids)].sort()  # Ids rejoués dans le désordre : rare
+        entry[1] = count + len(ids)
+
+    def _reserve(self, rows, name_bytes, ids):
+        # Croissance géométrique des colonnes : ajout amorti en O(1) par ligne
+        if rows > len(self.ids):
+            capacity = max(rows, 2 * len(self.ids), 1024)
+            for column in self.COLUMNS:
+                array = getattr(self, column)
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:self.size] = array[:self.size]
+                setattr(self, column, grown)
+        if name_bytes > len(self.names):
+            grown = np.empty(max(name_bytes, 2 * len(self.names), 16384), dtype=np.uint8)
+            grown[:self.names_size] = self.names[:self.names_size]
+            self.names = grown
+        if ids > len(self.row_of):
+            grown = np.full(max(ids, 2 * len(self.row_of), 1024), -1, dtype=np.int32)
+            grown[:len(self.row_of)] = self.row_of
+            self.row_of = grown
\ No newline at end of file
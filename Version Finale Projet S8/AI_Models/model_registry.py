@@ -0,0 +1,121 @@
+from imports import torch
+import gc
+import threading
+import time
+
+try:
+    import psutil  # Optionnel : mesure de la mémoire résidente du processus
+except ImportError:
+    psutil = None
+
+
+def _rss_bytes():
+    """Mémoire résidente du processus (None si psutil n'est pas installé)."""
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def _tensor_bytes(value):
+    """Taille des paramètres et buffers torch portés par `value` (ou son attribut `model`)."""
+    module = value if isinstance(value, torch.nn.Module) else getattr(value, "model", None)
+    if not isinstance(module, torch.nn.Module):
+        return 0
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelEntry:
+    """Un modèle chargé et ses mesures de chargement."""
+    def __init__(self, name, value, load_seconds, memory_bytes, rss_delta_bytes):
+        self.name = name
+        self.value = value
+        self.load_seconds = load_seconds
+        self.memory_bytes = memory_bytes
+        self.rss_delta_bytes = rss_delta_bytes
+        self.loaded_at = time.time()
+
+
+class ModelRegistry:
+    """
+    Registre des modèles du processus : chaque modèle est chargé une seule fois
+    puis partagé par tous les appelants (analyse de prompt, ingestion...).
+    """
+    def __init__(self):
+        self.entries = {}  # nom -> ModelEntry
+        self.lock = threading.Lock()
+        self._loading = {}  # nom -> Lock, pour ne pas charger deux fois le même modèle en parallèle
+
+    def get(self, name, loader):
+        """
+        Retourne le modèle `name`, en le chargeant avec `loader()` au premier appel.
+        """
+        entry = self.entries.get(name)
+        if entry is not None:
+            return entry.value
+
+        with self.lock:
+            name_lock = self._loading.setdefault(name, threading.Lock())
+        with name_lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                entry = self._load(name, loader)
+        return entry.value
+
+    def warm_up(self, name, loader, background=True):
+        """
+        Précharge un modèle (au démarrage de l'application par exemple).
+        Avec `background=True`, le chargement se fait dans un thread et celui-ci est retourné.
+        """
+        if not background:
+            self.get(name, loader)
+            return None
+        thread = threading.Thread(target=self.get, args=(name, loader), daemon=True)
+        thread.start()
+        return thread
+
+    def unload(self, name):
+        """Libère un modèle ; il sera rechargé au prochain `get`."""
+        with self.lock:
+            entry = self.entries.pop(name, None)
+        if entry is None:
+            return False
+        del entry
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"🗑️ Modèle '{name}' déchargé.")
+        return True
+
+    def is_loaded(self, name):
+        return name in self.entries
+
+    def stats(self):
+        """Temps de chargement et mémoire occupée par chaque modèle chargé."""
+        return {
+            name: {
+                "load_seconds": round(entry.load_seconds, 2),
+                "memory_mb": round(entry.memory_bytes / 2**20, 1),
+                "rss_delta_mb": round(entry.rss_delta_bytes / 2**20, 1) if entry.rss_delta_bytes is not None else None,
+            }
+            for name, entry in list(self.entries.items())
+        }
+
+    def _load(self, name, loader):
+        print(f"⏳ Chargement du modèle '{name}'...")
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        value = loader()
+        load_seconds = time.perf_counter() - start
+        rss_after = _rss_bytes()
+        rss_delta = rss_after - rss_before if rss_before is not None else None
+
+        entry = ModelEntry(name, value, load_seconds, _tensor_bytes(value), rss_delta)
+        with self.lock:
+            self.entries[name] = entry
+        print(f"✅ Modèle '{name}' chargé en {load_seconds:.2f}s ({entry.memory_bytes / 2**20:.1f} Mo de poids).")
+        return entry
+
+
+# Registre unique pour tout le processus
+model_registry = ModelRegistry()
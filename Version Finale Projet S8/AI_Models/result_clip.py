@@ -0,0 +1,102 @@
+from imports import cv2, os
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+SEEK_GAP = 30  # Au-delà de cet écart (en frames), repositionner la lecture plutôt que décoder les frames intermédiaires
+
+
+def find_source_video(bank_path, collection_name):
+    """Vidéo d'origine d'une collection dans la Bank (None si elle n'y est plus)."""
+    for extension in VIDEO_EXTENSIONS:
+        video_path = os.path.join(bank_path, collection_name + extension)
+        if os.path.exists(video_path):
+            return video_path
+    return None
+
+
+def iter_source_frames(video_path, frame_indices):
+    """
+    Lit les frames demandées d'une vidéo en un seul passage, dans l'ordre croissant des indices.
+    Les petits écarts sont franchis avec grab() (sans conversion d'image), les grands par un repositionnement.
+    Yields:
+        tuple: (index de la frame, image BGR).
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"❌ Unable to open video: {video_path}")
+        return
+    try:
+        position = 0  # Index de la prochaine frame décodée
+        for index in sorted(set(frame_indices)):
+            if index - position > SEEK_GAP:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+            while position < index:
+                if not cap.grab():
+                    return
+                position += 1
+            ok, frame = cap.read()
+            if not ok:
+                return
+            position += 1
+            yield index, frame
+    finally:
+        cap.release()
+
+
+class ResultClipWriter:
+    """Encode un mp4 frame par frame ; la taille de la vidéo est celle de la première frame."""
+    def __init__(self, output_path, fps):
+        self.output_path = output_path
+        self.fps = fps
+        self.writer = None
+        self.size = None
+        self.count = 0
+
+    def write(self, frame):
+        if self.writer is None:
+            height, width = frame.shape[:2]
+            self.size = (width, height)
+            self.writer = cv2.VideoWriter(self.output_path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, self.size)
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size)
+        self.writer.write(frame)
+        self.count += 1
+
+    def close(self):
+        """Termine la vidéo. Retourne le nombre de frames écrites."""
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+        return self.count
+
+
+def write_result_clip(output_path, collection_name, frames, bank_path, fps=30):
+    """
+    Écrit la vidéo des frames retenues d'une collection sans passer par des copies de JPEG.
+    Les frames sont relues directement dans la vidéo source (par leur `frame_index`) ; à défaut,
+    les miniatures de Bank/Frames sont décodées sur place.
+    Args:
+        frames (list): Résultats [{"id": nom de la frame, "frame_index": int ou None, ...}].
+    Returns:
+        int: Nombre de frames écrites.
+    """
+    writer = ResultClipWriter(output_path, fps)
+    video_path = find_source_video(bank_path, collection_name)
+    frame_indices = [frame.get("frame_index") for frame in frames]
+    if video_path is not None and None not in frame_indices:
+        for _, image in iter_source_frames(video_path, frame_indices):
+            writer.write(image)
+    else:
+        frames_dir = os.path.join(bank_path, "Frames", f"{collection_name}_frames")
+        for name in sorted(frame["id"] for frame in frames):
+            image_path = os.path.join(frames_dir, name)
+            image = cv2.imread(image_path) if os.path.exists(image_path) else None
+            if image is not None:
+                writer.write(image)
+
+    count = writer.close()
+    if count:
+        print(f"Video saved to '{output_path}' ({count} frames)")
+    else:
+        print(f"Error: No frames found for collection '{collection_name}'")
+    return count
@@ -1,44 +1,45 @@
 from PyQt6.QtCore import QThread, pyqtSignal
-
-class UploadThread(QThread):
-    upload_finished = pyqtSignal(str)
-    upload_failed = pyqtSignal(str)
-
-    def __init__(self, video_path, bank_path, client, target_fps=2):
-        super().__init__()
-        self.video_path = video_path
-        self.bank_path = bank_path
-        self.client = client
-        self.target_fps = target_fps
-
-    def run(self):
-        try:
-            from upload import process_upload
-            result_message = process_upload(self.video_path, self.bank_path, self.client, self.target_fps)
-            self.upload_finished.emit(result_message)
-        except Exception as e:
-            self.upload_failed.emit(f"❌ Error during upload: {e}")
-
+import threading
 
 class ClipAnalysisThread(QThread):
+    """
+    Analyse d'un prompt hors du thread de l'interface (chargement du modèle, recherche,
+    copie des frames et rendu vidéo). Le Top 5 de chaque collection est émis dès qu'il est connu.
+    """
+    partial_result = pyqtSignal(str, str, list)  # prompt, collection, Top 5 [{"id", "similarity"}]
     analysis_finished = pyqtSignal(str, str)
     analysis_failed = pyqtSignal(str)
+    analysis_cancelled = pyqtSignal()
 
-    def __init__(self, analysis_folder, video_path, target_fps=2, prompt=""):
+    def __init__(self, analysis_folder, prompt="", bank_path=None, collections=None, time_range=None):
         super().__init__()
         self.analysis_folder = analysis_folder
-        self.video_path = video_path
-        self.target_fps = target_fps
         self.prompt = prompt
+        self.bank_path = bank_path
+        self.collections = collections
+        self.time_range = time_range
         self.model_name = "Clip"
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        """Demande l'arrêt de l'analyse (pris en compte entre deux collections)."""
+        self.cancel_event.set()
 
     def run(self):
+        from AI_Models.Clip_Analysis import ClipAnalysis, AnalysisCancelled
+
         try:
-            from AI_Models.Clip_Analysis import analyse_prompt
-            result_folder = analyse_prompt(self.analysis_folder, self.prompt)
+            clip_analysis = ClipAnalysis(bank_path=self.bank_path)
+            result_folder = clip_analysis.analyse_prompt(
+                self.analysis_folder, self.prompt, collections=self.collections, time_range=self.time_range,
+                progress_callback=self.partial_result.emit, cancel_event=self.cancel_event,
+            )
             if result_folder:
                 self.analysis_finished.emit(result_folder, self.model_name)
             else:
                 self.analysis_failed.emit("❌ Analysis failed: No results generated.")
+        except AnalysisCancelled:
+            print(f"🛑 Analyse annulée : '{self.prompt}'")
+            self.analysis_cancelled.emit()
         except Exception as e:
             self.analysis_failed.emit(f"❌ Error during analysis: {e}")
\ No newline at end of file
@@ -7,7 +7,7 @@ import cv2
 import faiss
 import torch
 import numpy as np
-from AI_Models.threads import UploadThread, ClipAnalysisThread 
+from AI_Models.threads import ClipAnalysisThread 
 from AI_Models.Clip_Analysis import EmbeddingComparator
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QTreeWidget, QTreeWidgetItem, QPushButton, QStackedWidget, 
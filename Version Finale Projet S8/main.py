@@ -2,6 +2,7 @@ import os
 import sys
 from PyQt6.QtWidgets import QApplication
 from ui import VideoAnalysisUI
+from AI_Models.Clip_Analysis import warm_up_comparator
 
 BASE_DIR = os.getcwd()
 BANK_DIR = os.path.join(BASE_DIR, "Bank")
@@ -15,4 +16,5 @@ if __name__ == '__main__':
     app = QApplication(sys.argv)
     window = VideoAnalysisUI(BASE_DIR, BANK_DIR, ANALYSIS_DIR)
     window.show()
+    warm_up_comparator()  # Charger CLIP en arrière-plan pendant que la fenêtre s'ouvre
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,13 @@
+import os
+import sys
+import json
+import shutil
+import types
+import numpy as np
+import faiss
+
+# Le vrai `imports.py` charge PyQt6, torch et CLIP : les tests de la base FAISS n'ont besoin que de ceci
+imports = types.ModuleType("imports")
+imports.np, imports.faiss, imports.os, imports.json, imports.shutil = np, faiss, os, json, shutil
+sys.modules["imports"] = imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
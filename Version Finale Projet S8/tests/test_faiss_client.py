@@ -0,0 +1,235 @@
+import os
+import json
+import threading
+import faiss
+import numpy as np
+import pytest
+from AI_Models.faissClient import FaissClient
+
+DIMENSION = 8
+
+
+def vectors(n, seed):
+    rng = np.random.default_rng(seed)
+    v = rng.standard_normal((n, DIMENSION)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def add(client, collection, n, seed):
+    """Ajoute `n` vecteurs à une collection ; retourne les vecteurs ajoutés."""
+    v = vectors(n, seed)
+    client.add_to_collection(collection, [f"{collection}_{i:04d}.jpg" for i in range(n)], v,
+                             frame_indices=list(range(n)), timestamps=[i / 10 for i in range(n)])
+    return v
+
+
+def reload(path, mmap=True, **kwargs):
+    client = FaissClient(DIMENSION, mmap=mmap, **kwargs)
+    client.load(path)
+    return client
+
+
+def save(client, path):
+    client.save(path)
+    client.wait_for_compaction()
+
+
+def contents(client):
+    """{collection: vecteurs dans l'ordre des ids}, en vérifiant qu'aucun id n'est en double."""
+    ids, all_vectors = client.get_embeddings()
+    assert len(np.unique(ids)) == len(ids)
+    assert sorted(ids.tolist()) == sorted(client.metadata)
+    return {
+        name: all_vectors[np.isin(ids, collection_ids)]
+        for name, collection_ids in client.collection_ids().items()
+    }
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "data.faiss")
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_and_reload(path, mmap):
+    client = FaissClient(DIMENSION, mmap=mmap)
+    cam0 = add(client, "cam0", 50, seed=0)
+    save(client, path)
+    cam1 = add(client, "cam1", 30, seed=1)
+    more = add(client, "cam0", 20, seed=2)  # Va dans le segment du shard existant
+    save(client, path)
+
+    loaded = reload(path, mmap=mmap)
+    stored = contents(loaded)
+    assert loaded.collection_counts() == {"cam0": 70, "cam1": 30}
+    np.testing.assert_allclose(stored["cam0"], np.concatenate([cam0, more]))
+    np.testing.assert_allclose(stored["cam1"], cam1)
+    assert loaded.metadata[int(loaded.collection_ids()["cam1"][0])]["name"] == "cam1_0000.jpg"
+
+    assert loaded.search(cam1[3], k=1)[0]["name"] == "cam1_0003.jpg"
+
+    # Un nouvel ajout après rechargement ne réutilise pas d'id
+    add(loaded, "cam1", 5, seed=3)
+    save(loaded, path)
+    assert reload(path, mmap=mmap).collection_counts() == {"cam0": 70, "cam1": 35}
+
+
+def test_wal_replay_after_crash(path):
+    # compact_ratio énorme : après la première compaction, le journal n'est plus replié
+    client = FaissClient(DIMENSION, compact_ratio=1e9)
+    add(client, "cam0", 40, seed=0)
+    save(client, path)
+    add(client, "cam1", 10, seed=1)
+    add(client, "cam0", 5, seed=2)
+    save(client, path)
+    assert client._wal_bytes() > 0
+
+    # Arrêt brutal pendant l'écriture du journal : dernière ligne incomplète
+    with open(client._wal_path(), "ab") as f:
+        f.write(b'{"op": "add", "collection": "cam2", "first_')
+
+    loaded = reload(path, compact_ratio=1e9)
+    assert loaded.collection_counts() == {"cam0": 45, "cam1": 10}
+    contents(loaded)
+
+    # Les opérations suivantes commencent sur une nouvelle ligne du journal
+    add(loaded, "cam2", 7, seed=3)
+    loaded.delete_collection("cam1")
+    save(loaded, path)
+    again = reload(path, compact_ratio=1e9)
+    assert again.collection_counts() == {"cam0": 45, "cam2": 7}
+    contents(again)
+
+
+def test_compaction_during_adds(path):
+    client = FaissClient(DIMENSION, compact_ratio=0.0)  # Compaction en arrière-plan à chaque sauvegarde
+    expected = {"cam0": [add(client, "cam0", 20, seed=0)], "cam1": [add(client, "cam1", 20, seed=1)]}
+    save(client, path)
+
+    stop = threading.Event()
+    errors = []
+
+    def compact_loop():
+        try:
+            while not stop.is_set():
+                client.compact(force=True)
+        except Exception as e:  # Remonté dans le thread du test
+            errors.append(e)
+
+    compactor = threading.Thread(target=compact_loop)
+    compactor.start()
+    try:
+        for step in range(20):
+            collection = f"cam{step % 2}"
+            expected[collection].append(add(client, collection, 5, seed=10 + step))
+            client.save(path)
+    finally:
+        stop.set()
+        compactor.join()
+    client.wait_for_compaction()
+    assert not errors
+
+    for loaded in (client, reload(path)):
+        stored = contents(loaded)
+        assert loaded.collection_counts() == {"cam0": 70, "cam1": 70}
+        for name, parts in expected.items():
+            np.testing.assert_allclose(stored[name], np.concatenate(parts))
+
+
+def test_delete_then_re_add(path):
+    client = FaissClient(DIMENSION)
+    add(client, "cam0", 30, seed=0)
+    add(client, "cam1", 30, seed=1)
+    save(client, path)
+
+    client.delete_collection("cam0")
+    fresh = add(client, "cam0", 12, seed=2)
+    save(client, path)
+
+    for loaded in (client, reload(path)):
+        stored = contents(loaded)
+        assert loaded.collection_counts() == {"cam1": 30, "cam0": 12}
+        np.testing.assert_allclose(stored["cam0"], fresh)
+        # Les anciens vecteurs de cam0 ne ressortent plus d'une recherche sur toute la base
+        for results in loaded.search_batch(vectors(30, seed=0), k=1):
+            assert results[0]["similarity"] < 0.9999
+        assert set(loaded.collection_ids()["cam0"].tolist()).isdisjoint(loaded.collection_ids()["cam1"].tolist())
+
+
+def test_forced_compaction_then_crash(path):
+    client = FaissClient(DIMENSION)
+    first = add(client, "cam", 10, seed=0)
+    save(client, path)
+    more = add(client, "cam", 5, seed=1)
+    client.compact(force=True)  # Replie les vecteurs en attente dans la base, sans save()
+
+    # Arrêt brutal : le client n'est plus utilisé, seul le disque compte
+    loaded = reload(path)
+    assert loaded.collection_counts() == {"cam": 15}
+    np.testing.assert_allclose(contents(loaded)["cam"], np.concatenate([first, more]))
+
+    # Le prochain ajout ne réutilise pas les ids des vecteurs repliés
+    add(loaded, "cam", 3, seed=2)
+    save(loaded, path)
+    assert reload(path).collection_counts() == {"cam": 18}
+    contents(reload(path))
+
+
+def test_legacy_migration(path):
+    # Ancien format : un seul index numéroté par position + métadonnées JSON {id: {...}}
+    cam0, cam1 = vectors(20, seed=0), vectors(10, seed=1)
+    legacy = faiss.IndexFlatIP(DIMENSION)
+    legacy.add(np.concatenate([cam0, cam1]))
+    faiss.write_index(legacy, path)
+    metadata = {str(i): {"collection": "cam0" if i < 20 else "cam1", "name": f"f{i}.jpg"} for i in range(30)}
+    with open(path.replace(".faiss", "_metadata.json"), "w") as f:
+        json.dump(metadata, f)
+
+    migrated = reload(path)
+    assert os.path.exists(path.replace(".faiss", "_metadata.npz"))
+    assert not os.path.exists(path.replace(".faiss", "_metadata.json"))
+    for loaded in (migrated, reload(path)):
+        stored = contents(loaded)
+        np.testing.assert_allclose(stored["cam0"], cam0)
+        np.testing.assert_allclose(stored["cam1"], cam1)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_rebuild_from_ivfpq_keeps_original_vectors(path, mmap):
+    params = {"nlist": 2, "pq_m": 4, "pq_nbits": 4}  # 2^4 = 16 points suffisent à entraîner le PQ
+    client = FaissClient(DIMENSION, mmap=mmap)
+    client.index_type, client.index_params = "ivfpq", params
+    cam0 = add(client, "cam0", 200, seed=0)
+    save(client, path)
+    more = add(client, "cam0", 20, seed=1)  # Segment + .raw
+    client.compact(force=True)
+    cam1 = add(client, "cam1", 100, seed=2)
+    save(client, path)
+
+    loaded = reload(path, mmap=mmap)
+    stored = contents(loaded)
+    np.testing.assert_allclose(stored["cam0"], np.concatenate([cam0, more]))
+    np.testing.assert_allclose(stored["cam1"], cam1)
+
+    loaded.build_index("flat")
+    assert loaded.search(cam1[7], k=1)[0]["similarity"] == pytest.approx(1.0, abs=1e-5)
+    save(loaded, path)
+    flat = reload(path, mmap=mmap)
+    np.testing.assert_allclose(contents(flat)["cam0"], np.concatenate([cam0, more]), atol=1e-6)
+    assert not any(name.endswith(".raw") for name in os.listdir(path.replace(".faiss", "_shards")))
+
+    # Retour à IVF-PQ puis déplacement de la base : les vecteurs d'origine suivent
+    flat.build_index("ivfpq", **params)
+    moved = path.replace("data.faiss", "moved.faiss")
+    save(flat, moved)
+    np.testing.assert_allclose(contents(reload(moved, mmap=mmap))["cam1"], cam1, atol=1e-6)
+
+
+@pytest.mark.parametrize("index_type", ["ivf", "ivfpq"])
+def test_empty_upload_with_ivf_index(path, index_type):
+    client = FaissClient(DIMENSION)
+    client.index_type = index_type
+    client.add_to_collection("empty", [], np.empty((0, DIMENSION), dtype=np.float32))
+    more = add(client, "empty", 10, seed=0)  # Ajouts suivants dans le même shard
+    save(client, path)
+    np.testing.assert_allclose(contents(reload(path))["empty"], more)
@@ -14,6 +14,8 @@ class VideoAnalysisUI(QWidget):
         self.loading_timer = QTimer()
         self.loading_counter = 0
         self.isSeeking = False
+        self.analysisThread = None  # Analyse de prompt en cours (ClipAnalysisThread)
+        self.partialResults = {}  # collection -> meilleur résultat reçu pendant l'analyse
         # Initiate UI
         self.initUI()
         # Initial loading
@@ -457,38 +459,65 @@ class VideoAnalysisUI(QWidget):
 
     def start_analysis(self):
         """
-        Récupère le texte du chatBox et lance l'analyse avec le prompt.
+        Récupère le texte du chatBox et lance l'analyse du prompt dans un thread.
+        Pendant l'analyse, le bouton sert à l'annuler.
         """
+        if self.analysisThread is not None and self.analysisThread.isRunning():
+            self.analysisThread.cancel()
+            self.analyzeButton.setEnabled(False)
+            self.selectedVideoLabel.setText("Annulation en cours...")
+            return
+
         prompt = self.chatBox.toPlainText().strip()
         if not prompt:
             QMessageBox.warning(self, "Warning", "Please enter a prompt before starting the analysis.")
             return
 
-        try:
-            # Créer une instance de ClipAnalysis
-            clip_analysis = ClipAnalysis(bank_path=self.bankFolder)
-            # Appeler la méthode analyse_prompt sur l'instance
-            result_folder = clip_analysis.analyse_prompt(self.analysisFolder, prompt)
-            QMessageBox.information(self, "Analysis Complete", f"Results saved in: {result_folder}")
-            self.load_hierarchy(self.fileNav, self.analysisFolder)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"An error occurred during analysis: {e}")
-            print(f"❌ Error during analysis: {e}")
-
-    def on_analysis_finished(self, analysed_video_path):
-        """Handle analysis end and display appropriate file depending on the model"""
+        self.partialResults = {}
+        self.analysisThread = ClipAnalysisThread(self.analysisFolder, prompt, bank_path=self.bankFolder)
+        self.analysisThread.partial_result.connect(self.on_partial_result)
+        self.analysisThread.analysis_finished.connect(self.on_analysis_finished)
+        self.analysisThread.analysis_failed.connect(self.on_analysis_failed)
+        self.analysisThread.analysis_cancelled.connect(self.on_analysis_cancelled)
+        self.analyzeButton.setText("Cancel analysis")
+        self.update_loading_text()
+        self.analysisThread.start()
+
+    def on_partial_result(self, prompt, collection_name, top_results):
+        """Affiche le meilleur résultat de chaque collection dès qu'il est connu."""
+        self.partialResults[collection_name] = top_results[0]
+        lines = [
+            f"{name} : {result['id']} ({result['similarity']:.3f})"
+            for name, result in sorted(self.partialResults.items(), key=lambda item: -item[1]["similarity"])
+        ]
+        self.selectedVideoLabel.setText("Analyse en cours...\n" + "\n".join(lines))
+
+    def on_analysis_finished(self, result_folder, model_name):
+        """Handle analysis end and display its results folder."""
+        self.end_analysis()
+        print(f"✅ Analyse {model_name} terminée. Résultats : {result_folder}")
+        QMessageBox.information(self, "Analysis Complete", f"Results saved in: {result_folder}")
+        self.load_hierarchy(self.fileNav, self.analysisFolder)
+
+    def on_analysis_failed(self, message):
+        self.end_analysis()
+        print(message)
+        QMessageBox.critical(self, "Error", f"An error occurred during analysis: {message}")
+
+    def on_analysis_cancelled(self):
+        self.end_analysis()
+        self.load_hierarchy(self.fileNav, self.analysisFolder)  # Résultats partiels déjà écrits
+
+    def end_analysis(self):
+        """Reinitiate analysis widgets."""
         self.loading_timer.stop()
         self.loading_counter = 0
         # Stop and hide GIF
         self.loadingMovie.stop()
         self.loadingGifLabel.setVisible(False)
-        print(f"✅ Analyse terminée. Vidéo analysée : {analysed_video_path}")
-        # Reinitiate process
         self.selectedVideoLabel.setText("")
-        self.videoPath = None
-        self.load_hierarchy()
-        # Vérifier la base de données après l'analyse
-        print("🔍 Vérification de la base de données après l'analyse...")
+        self.analyzeButton.setText("Start analysis")
+        self.analyzeButton.setEnabled(True)
 
 
 
@@ -580,11 +609,9 @@ class VideoAnalysisUI(QWidget):
 
     def closeEvent(self, event):
         """Handle application close event."""
-        global upload_threads
-        for thread in upload_threads:
-            if thread.isRunning():
-                print(f"🛑 Arrêt du thread : {thread}")
-                thread.terminate()
-                thread.wait()
-        upload_threads.clear()
+        shutdown_ingest()  # Annule les uploads en cours et attend les threads d'ingestion
+        if self.analysisThread is not None and self.analysisThread.isRunning():
+            self.analysisThread.cancel()
+            self.analysisThread.wait()
+        text_embedding_cache.save()  # Une seule écriture du cache des prompts, hors du chemin des recherches
         event.accept()
\ No newline at end of file
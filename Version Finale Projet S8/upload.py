@@ -1,7 +1,8 @@
 from imports import *
 from utils import load_hierarchy
 from AI_Models.Clip_Analysis import ClipAnalysis
-from AI_Models.threads import UploadThread
+from AI_Models.ingest_pipeline import IngestPipeline, IngestCancelled
+from AI_Models.ingest_scheduler import IngestScheduler
 from AI_Models.faiss_instance import faiss_client
 
 import gc
@@ -9,87 +10,125 @@ import gc
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Root folder
 LOGO_PATH = os.path.join(BASE_DIR, "assets/logo.png")  # Logo path
 
-def process_upload(video_path, bank_path, client, target_fps=2):
+def process_upload(video_path, bank_path, client, target_fps=2, batch_size=16, save_frames=True,
+                   comparator=None, progress_callback=None, cancel_event=None):
     """
     Gère l'upload d'une vidéo : extraction des frames, génération des embeddings, ajout à FAISS.
+    L'ingestion passe par un pipeline à trois étages (décodage, encodage CLIP par batch de
+    `batch_size` frames, écriture) reliés par des files bornées, afin que le décodage et
+    l'écriture des miniatures se recouvrent avec l'inférence.
+    Seules `target_fps` frames par seconde sont retenues ; chaque frame garde son index
+    d'origine et son timestamp dans la vidéo. Si `save_frames` est vrai, les miniatures
+    sont écrites dans Bank/Frames.
+    `comparator` permet de réutiliser un modèle CLIP déjà chargé ; `progress_callback` reçoit
+    le nombre de frames encodées ; `cancel_event` (threading.Event) interrompt l'ingestion.
     """
     try:
         print(f"🔍 Vérification de l'existence de la vidéo : {video_path}")
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"❌ Video file not found: {video_path}")
 
-        print(f"📂 Création du dossier des frames pour la vidéo : {video_path}")
         video_name = os.path.splitext(os.path.basename(video_path))[0]
-        frames_dir = os.path.join(bank_path, "Frames", f"{video_name}_frames")
-        os.makedirs(frames_dir, exist_ok=True)
+        frames_dir = None
+        if save_frames:
+            print(f"📂 Création du dossier des frames pour la vidéo : {video_path}")
+            frames_dir = os.path.join(bank_path, "Frames", f"{video_name}_frames")
+            os.makedirs(frames_dir, exist_ok=True)
 
-        print(f"🎥 Début de l'extraction des frames et de la génération des embeddings.")
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise RuntimeError(f"❌ Unable to open video: {video_path}")
-
-        # Charger l'index FAISS existant (s'il existe)
         faiss_index_path = os.path.join(BASE_DIR, "data.faiss")
-        if os.path.exists(faiss_index_path):
-            print(f"🔄 Chargement de l'index FAISS existant depuis '{faiss_index_path}'...")
-            client.load(faiss_index_path)
-        else:
-            print(f"⚠️ Aucun index FAISS existant trouvé. Un nouvel index sera créé.")
-
-        comparator = ClipAnalysis(bank_path).comparator
-
-        frame_count = 0
-        ids = []
-        embeddings = []
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            # Sauvegarder la frame sur le disque
-            frame_file_name = f"frame_{frame_count:06d}.jpg"
-            frame_path = os.path.join(frames_dir, frame_file_name)
-            cv2.imwrite(frame_path, frame)
-            print(f"✅ Frame sauvegardée : {frame_file_name}")
-
-            # Générer l'embedding pour la frame
-            embedding = comparator.encode_image(frame_path)
-            embeddings.append(embedding[0])
-            ids.append(frame_file_name)
-            frame_count += 1
+        if comparator is None:
+            comparator = ClipAnalysis(bank_path).comparator
+
+        print(f"🎥 Début de l'extraction des frames et de la génération des embeddings.")
+        pipeline = IngestPipeline(
+            video_path, comparator, frames_dir=frames_dir, target_fps=target_fps, batch_size=batch_size,
+            progress_callback=progress_callback, cancel_event=cancel_event
+        )
+        result = pipeline.run()
+        pipeline.report()
 
         # Ajouter les embeddings à la collection FAISS
-        client.add_to_collection(video_name, ids, embeddings)
-        client.save(faiss_index_path)  # Sauvegarder l'index FAISS mis à jour
+        client.add_to_collection(
+            video_name, result["ids"], result["embeddings"],
+            frame_indices=result["frame_indices"], timestamps=result["timestamps"]
+        )
+        client.save(faiss_index_path)  # N'écrit que les nouvelles frames (segment + journal)
         print(f"✅ Sauvegarde de l'index FAISS terminée.")
 
-        cap.release()
         gc.collect()
-        print(f"✅ Extraction et génération des embeddings terminées. Total frames : {frame_count}")
+        print(f"✅ Extraction et génération des embeddings terminées. Total frames : {len(result['ids'])} / {pipeline.source_frames}")
         return f"✅ Upload terminé pour la vidéo : {video_path}"
 
+    except IngestCancelled:
+        raise
     except Exception as e:
         print(f"❌ Error in process_upload: {e}")
         raise RuntimeError(f"❌ Error in process_upload: {e}")
 
-upload_threads = []  # Liste globale pour conserver les références aux threads
+INGEST_CONCURRENCY = 2  # Nombre de vidéos ingérées en parallèle (un seul modèle CLIP partagé)
+ingest_scheduler = None  # Ordonnanceur créé au premier upload (après QApplication)
 
-def add_item(bank_path, client, extractionLabel, extractionGifLabel, extractionMovie, bankNav):
+def get_ingest_scheduler(client, bank_path, extractionLabel, extractionGifLabel, extractionMovie, bankNav):
+    """
+    Retourne l'ordonnanceur d'ingestion partagé, en le créant et en connectant
+    ses signaux à l'interface au premier appel.
     """
-    Ouvre une fenêtre pour sélectionner une vidéo et l'ajouter à la Bank.
+    global ingest_scheduler
+    if ingest_scheduler is None:
+        ingest_scheduler = IngestScheduler(client, max_concurrent=INGEST_CONCURRENCY)
+
+        def update_status(*_):
+            pending = ingest_scheduler.pending_count()
+            extractionLabel.setText(f"Uploading... ({pending} en cours)")
+
+        def on_progress(video_path, count):
+            extractionLabel.setText(f"Uploading {os.path.basename(video_path)} : {count} frames")
+
+        ingest_scheduler.job_started.connect(update_status)
+        ingest_scheduler.job_progress.connect(on_progress)
+        ingest_scheduler.job_finished.connect(lambda video_path, msg: print(msg))
+        ingest_scheduler.job_finished.connect(lambda *_: load_hierarchy(bankNav, bank_path))
+        ingest_scheduler.job_failed.connect(lambda video_path, msg: QMessageBox.critical(None, "Error", msg))
+        ingest_scheduler.job_cancelled.connect(lambda video_path: print(f"🛑 Upload annulé : {video_path}"))
+        def on_all_finished(succeeded, failed, cancelled):
+            hide_extraction_status(extractionLabel, extractionGifLabel, extractionMovie)
+            if not succeeded:
+                return  # Échecs déjà signalés un par un, annulations volontaires
+            msg = "✅ Upload terminé."
+            if failed or cancelled:
+                msg += f" ({succeeded} réussi(s), {failed} échec(s), {cancelled} annulé(s))"
+            on_extraction_finished(msg, bankNav, bank_path)
+
+        ingest_scheduler.all_finished.connect(on_all_finished)
+    return ingest_scheduler
+
+def shutdown_ingest():
+    """Annule les uploads en cours et attend l'arrêt des threads d'ingestion."""
+    if ingest_scheduler is not None:
+        ingest_scheduler.shutdown()
+
+def add_item(bank_path, client, extractionLabel, extractionGifLabel, extractionMovie, bankNav, priority=0):
     """
-    file_path, _ = QFileDialog.getOpenFileName(None, "Select a file to add to Bank", "", "Video Files (*.mp4 *.avi *.mov *.mkv)")
-    if not file_path:
+    Ouvre une fenêtre pour sélectionner une ou plusieurs vidéos et les ajouter à la Bank.
+    Les vidéos sont placées dans la file de l'ordonnanceur d'ingestion.
+    """
+    file_paths, _ = QFileDialog.getOpenFileNames(None, "Select files to add to Bank", "", "Video Files (*.mp4 *.avi *.mov *.mkv)")
+    if not file_paths:
         return
 
-    target_path = os.path.join(bank_path, os.path.basename(file_path))
-    if os.path.exists(target_path):
-        QMessageBox.information(None, "File Exists", f"The file '{os.path.basename(file_path)}' already exists in the Bank folder.")
-        return
+    scheduler = get_ingest_scheduler(client, bank_path, extractionLabel, extractionGifLabel, extractionMovie, bankNav)
+    for file_path in file_paths:
+        target_path = os.path.join(bank_path, os.path.basename(file_path))
+        if os.path.exists(target_path):
+            QMessageBox.information(None, "File Exists", f"The file '{os.path.basename(file_path)}' already exists in the Bank folder.")
+            continue
 
-    try:
-        shutil.copy(file_path, target_path)
+        try:
+            shutil.copy(file_path, target_path)
+        except Exception as e:
+            print(f"❌ Error copying file: {e}")
+            QMessageBox.critical(None, "Error", f"Failed to copy file: {e}")
+            continue
 
         # Mettre à jour l'interface utilisateur
         extractionLabel.setText(f"Uploading...")
@@ -97,23 +136,7 @@ def add_item(bank_path, client, extractionLabel, extractionGifLabel, extractionM
         extractionGifLabel.setVisible(True)
         extractionMovie.start()
 
-        # Lancer le thread d'upload
-        thread = UploadThread(target_path, bank_path, client, target_fps=2)
-        upload_threads.append(thread)  # Conserver une référence au thread
-        print(f"🔍 Thread ajouté : {thread}")
-
-        thread.upload_finished.connect(lambda msg: QMessageBox.information(None, "Success", msg))
-        thread.upload_finished.connect(lambda: hide_extraction_status(extractionLabel, extractionGifLabel, extractionMovie))
-        thread.upload_finished.connect(lambda: upload_threads.remove(thread))  # Nettoyer après la fin
-        thread.upload_finished.connect(lambda msg: on_extraction_finished(msg, bankNav, bank_path))
-        thread.upload_failed.connect(lambda msg: QMessageBox.critical(None, "Error", msg))
-        thread.upload_failed.connect(lambda: hide_extraction_status(extractionLabel, extractionGifLabel, extractionMovie))
-        thread.upload_failed.connect(lambda: upload_threads.remove(thread))  # Nettoyer après la fin
-        thread.start()
-        
-    except Exception as e:
-        print(f"❌ Error copying file: {e}")
-        QMessageBox.critical(None, "Error", f"Failed to copy file: {e}")
+        scheduler.submit(target_path, bank_path, priority=priority, target_fps=2)
 
 def hide_extraction_status(extractionLabel, extractionGifLabel, extractionMovie):
     """Hide the extraction message and GIF."""
@@ -8,6 +8,7 @@ import json
 import numpy as np
 import faiss
 import datetime
+from detection_store import DetectionStore, STORE_DIR
 
 class Florence2Analysis:
     def __init__(self, analysis_folder):
@@ -46,7 +47,9 @@ class Florence2Analysis:
         duration = total_frames / fps
         frame_interval = int(fps / target_fps)
         frame_count = 0
-        detections = []
+        # Colonnes des détections (une ligne par boîte) ; Florence-2 ne donne ni id de classe ni score
+        columns = {"frame": [], "timestamp": [], "class_id": [], "box": [], "confidence": [], "faiss_id": []}
+        class_ids = {}  # Nom de classe -> id, attribué à la première apparition
         embeddings_list = []
 
         while True:
@@ -75,12 +78,16 @@ class Florence2Analysis:
                     generated_text, task="<OD>", image_size=(image.width, image.height)
                 )
 
-                # Sauvegarder les résultats
-                detection_path = os.path.join(analysed_frames_dir, f"detection_{frame_count:06d}.json")
-                with open(detection_path, "w") as f:
-                    json.dump(parsed_answer, f, indent=4)
-                detections.append(parsed_answer)
-                print(f"✅ Résultats sauvegardés : {detection_path}")
+                # Ajouter les boîtes (x1, y1, x2, y2) aux colonnes, au format centre / largeur / hauteur
+                od = parsed_answer.get("<OD>", {})
+                for (x1, y1, x2, y2), label in zip(od.get("bboxes", []), od.get("labels", [])):
+                    columns["frame"].append(frame_count)
+                    columns["timestamp"].append(frame_count / fps)
+                    columns["class_id"].append(class_ids.setdefault(label, len(class_ids)))
+                    columns["box"].append(((x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1))
+                    columns["confidence"].append(np.nan)
+                    columns["faiss_id"].append(len(embeddings_list))  # Un embedding par frame, ajouté ci-dessous
+                print(f"✅ Frame analysée : {len(od.get('labels', []))} détection(s)")
 
                 # Générer un embedding pour l'annotation textuelle
                 embedding = self.text_embedder.encode(generated_text, convert_to_tensor=False)
@@ -93,10 +100,13 @@ class Florence2Analysis:
         # Capturer le timestamp de fin
         end_time = datetime.datetime.now()
 
-        # Sauvegarder toutes les détections dans un fichier global
-        detections_path = os.path.join(video_folder, "detections.json")
-        with open(detections_path, "w") as f:
-            json.dump(detections, f, indent=4)
+        # Sauvegarder toutes les détections dans le store en colonnes
+        detections_path = os.path.join(video_folder, STORE_DIR)
+        DetectionStore.write(
+            detections_path, columns["frame"], columns["timestamp"], columns["class_id"], columns["box"],
+            columns["confidence"], {class_id: name for name, class_id in class_ids.items()},
+            image_pattern="Extracted_Frames/frame_{frame:06d}.jpg", faiss_id=columns["faiss_id"],
+        )
         print(f"✅ Analyse terminée. Résultats sauvegardés dans : {detections_path}")
 
         # Sauvegarder les embeddings dans un fichier .faiss
@@ -108,7 +118,10 @@ class Florence2Analysis:
         return video_folder
 
     def save_embeddings_to_faiss(self, embeddings_list, video_folder):
-        """Enregistre les embeddings dans un fichier .faiss."""
+        """
+        Enregistre les embeddings dans un fichier .faiss.
+        Un embedding par frame analysée : l'id FAISS d'une détection est dans la colonne faiss_id du store.
+        """
         if not embeddings_list:
             print("❌ Aucun embedding généré. Les résultats ne peuvent pas être enregistrés.")
             return
@@ -3,17 +3,32 @@ import json
 import datetime
 import cv2
 import concurrent.futures
+import collections
 import numpy as np
 import faiss
 import shutil
 from ultralytics import YOLO
 from sentence_transformers import SentenceTransformer
+from frame_sampler import sample_batches
+from detector_pool import DetectorPool, analyse_frame, EMBEDDER_NAME
+from frame_detections import DetectionColumns
+from detection_store import DetectionStore, STORE_DIR
+
+IMAGE_EXTENSION = ".png"  # Format des frames extraites et annotées
 
 class Yolo11VideoAnalysis:
     def __init__(self, analysis_folder):
         self.analysis_folder = analysis_folder
-        self.model = YOLO("yolo11n.pt")
-        self.embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        self.model_path = "yolo11n.pt"
+        self.model = None  # Chargés par load_models() en mode threads ; en mode processus, chaque worker a les siens
+        self.embedder = None
+
+    def load_models(self):
+        """Charge le détecteur et l'encodeur de texte une seule fois (mode threads)."""
+        if self.model is None:
+            self.model = YOLO(self.model_path)
+        if self.embedder is None:
+            self.embedder = SentenceTransformer(EMBEDDER_NAME)
 
     def create_video_folders(self, video_folder):
         """Crée les dossiers nécessaires pour stocker les frames extraites et analysées."""
@@ -26,8 +41,12 @@ class Yolo11VideoAnalysis:
         
         return extracted_frames_dir, analysed_frames_dir
 
-    def extract_and_process_frames(self, video_path, target_fps, model_name, num_threads=4, existing_folder=None):
-        """Extrait les frames d'une vidéo et les analyse avec YOLO."""
+    def extract_and_process_frames(self, video_path, target_fps, model_name, num_threads=4, existing_folder=None, batch_size=8,
+                                   use_processes=False):
+        """Extrait les frames d'une vidéo et les analyse avec YOLO, par lots de `batch_size` frames.
+        Avec `use_processes=True`, les lots sont analysés par `num_threads` processus (voir DetectorPool)
+        au lieu de threads qui partagent le même modèle.
+        """
         video_name = os.path.splitext(os.path.basename(video_path))[0]
         start_time = datetime.datetime.now()
         # Utiliser le dossier existant ou en créer un nouveau
@@ -71,94 +90,77 @@ class Yolo11VideoAnalysis:
         print(f"🎥 Vidéo : {video_name}, FPS : {original_fps}, Total Frames : {total_frames}, Durée : {duration:.2f}s")
 
         target_timestamps = [i / target_fps for i in range(int(duration * target_fps))]
-        detections_data = []
-        embeddings_list = []
-
-        # Analyse des frames en parallèle
-        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-            futures = [
-                executor.submit(
-                    self.process_frame,
-                    video_path, timestamp, frame_number, video_name, extracted_dir, analysed_dir, detections_data, embeddings_list
-                )
-                for frame_number, timestamp in enumerate(target_timestamps)
-            ]
-            concurrent.futures.wait(futures)
+        frames = []  # Un FrameDetections par frame, ajouté dans l'ordre des frames par le seul thread principal
+
+        # Un seul décodeur parcourt la vidéo ; les frames sont regroupées par lots de `batch_size` et chaque
+        # lot passe par un seul appel du modèle. Sauvegardes et embeddings sont faits en parallèle, au fil de l'eau ;
+        # chaque tâche retourne son résultat au lieu d'écrire dans des listes partagées, qui pouvaient entrelacer
+        # les détections d'une frame avec les embeddings d'une autre.
+        max_pending = num_threads * 2  # Frames (ou lots en mode processus) en attente : mémoire bornée
+        if use_processes:
+            # Détection et post-traitement dans les processus du pool ; résultats fusionnés dans l'ordre des frames
+            with DetectorPool(self.model_path, num_workers=num_threads) as pool:
+                pending = collections.deque()
+                for batch in sample_batches(video_path, target_timestamps, batch_size):
+                    if len(pending) >= max_pending:
+                        frames.extend(pending.popleft().result())
+                    pending.append(pool.submit(batch, video_name, extracted_dir, analysed_dir, IMAGE_EXTENSION))
+                while pending:
+                    frames.extend(pending.popleft().result())
+        else:
+            self.load_models()  # Avant les threads : ils partagent le même détecteur et le même encodeur
+            with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+                pending = collections.deque()
+                for batch in sample_batches(video_path, target_timestamps, batch_size):
+                    results = self.model([frame for _, _, frame in batch], verbose=False)
+                    for (frame_number, _, frame), result in zip(batch, results):
+                        if len(pending) >= max_pending:
+                            frames.append(pending.popleft().result())
+                        pending.append(executor.submit(
+                            self.process_frame, frame, result, frame_number, video_name, extracted_dir, analysed_dir
+                        ))
+                while pending:
+                    frames.append(pending.popleft().result())
 
         end_time = datetime.datetime.now()
         print(f"🔍 Analyse terminée pour toutes les frames.")
 
         # Enregistrer les résultats
-        self.save_analysis_results(detections_data, embeddings_list, video_folder)
+        self.save_analysis_results(DetectionColumns.from_frames(frames, target_timestamps), video_folder, video_name)
 
         # Générer le fichier info.json
         self.generate_info_file(video_name, video_folder, duration, total_frames, original_fps, start_time, end_time)
 
         return video_folder, video_name
 
-    def process_frame(self, video_path, timestamp, frame_number, video_name, extracted_dir, analysed_dir, detections_data, embeddings_list):
-        """Traite une frame spécifique : extraction, analyse et annotation."""
-        cap = cv2.VideoCapture(video_path)
-        cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
-        success, frame = cap.read()
-        cap.release()
-
-        if success:
-            # Sauvegarder la frame extraite
-            frame_filename = os.path.join(extracted_dir, f"{video_name}_frame{frame_number:06d}.png")
-            cv2.imwrite(frame_filename, frame)
-            print(f"✅ Frame extraite et sauvegardée : {frame_filename}")
-
-            # Analyse avec YOLO
-            results = self.model(frame_filename)
-            if results:
-                annotated_filename = os.path.join(analysed_dir, f"{video_name}_Analysed_frame{frame_number:06d}.png")
-                results[0].save(filename=annotated_filename)
-                print(f"✅ Frame annotée sauvegardée : {annotated_filename}")
-
-                # Collecter les données des détections
-                for result in results:
-                    boxes = result.boxes.xywh.cpu().numpy()
-                    confs = result.boxes.conf.cpu().numpy()
-                    classes = result.boxes.cls.cpu().numpy()
-                    class_names = [result.names[int(cls)] for cls in classes]
-
-                    for i in range(len(boxes)):
-                        detection = {
-                            "image": frame_filename,
-                            "class": class_names[i],
-                            "x": float(boxes[i][0]),
-                            "y": float(boxes[i][1]),
-                            "width": float(boxes[i][2]),
-                            "height": float(boxes[i][3]),
-                            "confidence": float(confs[i]),
-                        }
-                        detections_data.append(detection)
-
-                        # Générer des embeddings pour chaque détection
-                        text_data = f"{frame_filename} {detection['class']} {detection['x']} {detection['y']} {detection['width']} {detection['height']} {detection['confidence']}"
-                        embeddings_list.append(self.embedder.encode(text_data))
-            else:
-                print(f"❌ Aucune détection trouvée pour la frame : {frame_filename}")
-        else:
-            print(f"❌ Échec de l'extraction de la frame au timestamp {timestamp}s")
-
-    def save_analysis_results(self, detections_data, embeddings_list, video_folder):
-        """Enregistre les résultats d'analyse dans des fichiers JSON et FAISS."""
-        detections_path = os.path.join(video_folder, "detections.json")
+    def process_frame(self, frame, result, frame_number, video_name, extracted_dir, analysed_dir):
+        """
+        Traite une frame déjà décodée et son résultat YOLO (inférence par lot) : sauvegarde et annotation.
+        Returns:
+            FrameDetections: détections de la frame et leurs embeddings.
+        """
+        return analyse_frame(
+            frame, result, frame_number, video_name, extracted_dir, analysed_dir, IMAGE_EXTENSION, self.embedder
+        )
+
+    def save_analysis_results(self, detections, video_folder, video_name):
+        """
+        Enregistre les résultats d'analyse dans un store de détections en colonnes et un index FAISS.
+        La détection i du store correspond à l'id i de l'index FAISS (colonne faiss_id).
+        """
+        detections_path = os.path.join(video_folder, STORE_DIR)
         vdb_path = os.path.join(video_folder, "vector_database.faiss")
 
-        # Vérifier si embeddings_list est vide
-        if not embeddings_list:
+        # Vérifier s'il y a des embeddings
+        if len(detections) == 0:
             print("❌ Aucun embedding généré. Les résultats ne peuvent pas être enregistrés.")
             return
 
-        embeddings_np = np.array(embeddings_list).astype('float32')
-        index = faiss.IndexFlatL2(embeddings_np.shape[1])
-        index.add(embeddings_np)
+        index = faiss.IndexFlatL2(detections.embeddings.shape[1])
+        index.add(detections.embeddings)
 
-        with open(detections_path, "w") as f:
-            json.dump(detections_data, f, indent=4)
+        image_pattern = f"Extracted_Frames/{video_name}_frame{{frame:06d}}{IMAGE_EXTENSION}"
+        DetectionStore.write_columns(detections_path, detections, image_pattern)
 
         faiss.write_index(index, vdb_path)
         print(f"✅ Résultats enregistrés dans '{detections_path}' et '{vdb_path}'")
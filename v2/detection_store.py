@@ -0,0 +1,142 @@
+import os
+import json
+import shutil
+import numpy as np
+
+STORE_DIR = "detections"  # Dossier du store dans le dossier d'analyse d'une vidéo
+COLUMNS = {
+    "frame": np.int32,
+    "timestamp": np.float32,
+    "class_id": np.int32,
+    "box": np.float32,  # (N, 4) : x, y (centre), largeur, hauteur
+    "confidence": np.float32,  # NaN si le modèle ne donne pas de score (Florence-2)
+    "faiss_id": np.int64,  # Id de l'embedding de la détection dans l'index FAISS de l'analyse
+}
+
+
+class DetectionStore:
+    """
+    Détections d'une vidéo en colonnes : un fichier .npy par colonne (frame, timestamp, classe, boîte, confiance)
+    et un meta.json avec le dictionnaire des classes et le modèle du chemin des frames extraites.
+    La colonne faiss_id relie chaque détection à l'index FAISS de l'analyse : id i = détection i pour YOLO
+    (un embedding par détection), id de la frame pour Florence-2 (un embedding par frame).
+    Les colonnes sont lues en mémoire mappée : ouvrir le store d'une analyse de plusieurs heures ne charge rien,
+    et un filtre ne lit que les lignes des frames demandées (les lignes sont triées par frame).
+    """
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.classes = {int(class_id): name for class_id, name in meta["classes"].items()}
+        self.image_pattern = meta.get("image_pattern")
+        mmap_mode = "r" if mmap else None
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+
+    def __len__(self):
+        return len(self.frame)
+
+    @staticmethod
+    def write(path, frame, timestamp, class_id, box, confidence, classes, image_pattern=None, faiss_id=None):
+        """
+        Écrit un store (remplace l'existant). Les lignes doivent être dans l'ordre des frames.
+        Args:
+            classes (dict): {id de classe: nom}.
+            image_pattern (str): Chemin d'une frame extraite relatif au dossier de la vidéo,
+                avec `{frame}` pour le numéro de frame (ex. "Extracted_Frames/frame_{frame:06d}.jpg").
+            faiss_id (list): Id FAISS de chaque détection (par défaut, la détection i a l'id i).
+        """
+        if faiss_id is None:
+            faiss_id = np.arange(len(frame))
+        data = {
+            "frame": frame, "timestamp": timestamp, "class_id": class_id, "box": box, "confidence": confidence,
+            "faiss_id": faiss_id,
+        }
+        data = {name: np.asarray(values, dtype=COLUMNS[name]) for name, values in data.items()}
+        data["box"] = data["box"].reshape(-1, 4)
+        if np.any(np.diff(data["frame"]) < 0):
+            raise ValueError("Les détections doivent être triées par frame.")
+
+        # Écriture dans un dossier temporaire, puis remplacement : un store n'est jamais à moitié écrit
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, values in data.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+        meta = {
+            "count": len(data["frame"]),
+            "classes": {str(class_id): name for class_id, name in sorted(classes.items())},
+            "image_pattern": image_pattern,
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=4)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        print(f"✅ {meta['count']} détections enregistrées dans : {path}")
+
+    @classmethod
+    def write_columns(cls, path, detections, image_pattern=None):
+        """Écrit un `DetectionColumns` (analyses YOLO)."""
+        cls.write(
+            path, detections.frame, detections.timestamp, detections.class_id, detections.box,
+            detections.confidence, detections.class_names, image_pattern,
+        )
+
+    def class_id_of(self, class_name):
+        """Id d'une classe d'après son nom (None si la vidéo n'en contient pas)."""
+        return next((class_id for class_id, name in self.classes.items() if name == class_name), None)
+
+    def select(self, class_name=None, min_confidence=None, frames=None, time_range=None):
+        """
+        Indices des détections qui passent tous les filtres donnés,
+        ex. select("person", min_confidence=0.6, frames=(1000, 2000)).
+        Args:
+            frames (tuple): (première, dernière) frame, bornes incluses.
+            time_range (tuple): (début, fin) en secondes, bornes incluses.
+        Returns:
+            np.ndarray: Indices croissants (int64) des lignes ; `faiss_id[indices]` donne leurs ids FAISS.
+        """
+        start, end = 0, len(self)
+        if frames is not None:
+            # Colonne triée : la plage de frames est une tranche, trouvée par dichotomie
+            start = int(np.searchsorted(self.frame, frames[0], side="left"))
+            end = int(np.searchsorted(self.frame, frames[1], side="right"))
+        mask = np.ones(max(end - start, 0), dtype=bool)
+        if class_name is not None:
+            class_id = self.class_id_of(class_name)
+            if class_id is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.class_id[start:end] == class_id
+        if min_confidence is not None:
+            mask &= self.confidence[start:end] > min_confidence
+        if time_range is not None:
+            timestamps = self.timestamp[start:end]
+            mask &= (timestamps >= time_range[0]) & (timestamps <= time_range[1])
+        return np.flatnonzero(mask) + start
+
+    def image(self, index):
+        """Chemin de la frame extraite d'une détection (None si le store n'a pas de modèle de chemin)."""
+        if self.image_pattern is None:
+            return None
+        video_folder = os.path.dirname(os.path.abspath(self.path))
+        return os.path.join(video_folder, self.image_pattern.format(frame=int(self.frame[index])))
+
+    def records(self, indices=None):
+        """Détections sous forme de dictionnaires (ancien format de detections.json), pour l'export ou le débogage."""
+        if indices is None:
+            indices = range(len(self))
+        return [
+            {
+                "image": self.image(i),
+                "frame": int(self.frame[i]),
+                "timestamp": float(self.timestamp[i]),
+                "class": self.classes[int(self.class_id[i])],
+                "x": float(self.box[i][0]),
+                "y": float(self.box[i][1]),
+                "width": float(self.box[i][2]),
+                "height": float(self.box[i][3]),
+                "confidence": float(self.confidence[i]),
+                "faiss_id": int(self.faiss_id[i]),
+            }
+            for i in indices
+        ]
@@ -0,0 +1,123 @@
+import os
+import cv2
+import numpy as np
+import concurrent.futures
+import multiprocessing
+from multiprocessing import shared_memory
+from frame_detections import FrameDetections
+
+EMBEDDER_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# Modèles du processus worker (chargés une seule fois par `_init_worker`)
+_model = None
+_embedder = None
+
+
+def analyse_frame(frame, result, frame_number, video_name, extracted_dir, analysed_dir, image_extension, embedder):
+    """
+    Sauvegarde une frame et son annotation YOLO, puis décrit ses détections.
+    Returns:
+        FrameDetections: détections de la frame et embeddings de texte associés (même ordre).
+    """
+    # Sauvegarder la frame extraite
+    frame_filename = os.path.join(extracted_dir, f"{video_name}_frame{frame_number:06d}{image_extension}")
+    cv2.imwrite(frame_filename, frame)
+    print(f"✅ Frame extraite et sauvegardée : {frame_filename}")
+
+    # Sauvegarder l'image annotée
+    annotated_filename = os.path.join(analysed_dir, f"{video_name}_Analysed_frame{frame_number:06d}{image_extension}")
+    result.save(filename=annotated_filename)
+    print(f"✅ Frame annotée sauvegardée : {annotated_filename}")
+
+    # Collecter les données des détections
+    boxes = result.boxes.xywh.cpu().numpy()
+    confs = result.boxes.conf.cpu().numpy()
+    class_ids = result.boxes.cls.cpu().numpy().astype(np.int32)
+    class_names = {int(class_id): result.names[int(class_id)] for class_id in class_ids}
+    if len(boxes) == 0:
+        print(f"❌ Aucune détection trouvée pour la frame : {frame_filename}")
+        return FrameDetections(frame_number, frame_filename, class_ids, boxes, confs, None, class_names)
+
+    # Générer les embeddings de toutes les détections de la frame en un seul appel
+    texts = [
+        f"{frame_filename} {class_names[int(class_id)]} {float(box[0])} {float(box[1])} {float(box[2])} {float(box[3])} {float(conf)}"
+        for class_id, box, conf in zip(class_ids, boxes, confs)
+    ]
+    embeddings = np.asarray(embedder.encode(texts), dtype=np.float32)
+    return FrameDetections(frame_number, frame_filename, class_ids, boxes, confs, embeddings, class_names)
+
+
+def _init_worker(model_path, embedder_name, torch_threads):
+    """Charge le détecteur et l'encodeur une fois pour toute la vie du processus worker."""
+    global _model, _embedder
+    import torch
+    from ultralytics import YOLO
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(torch_threads)  # Pas de sur-souscription des cœurs entre workers
+    _model = YOLO(model_path)
+    _embedder = SentenceTransformer(embedder_name)
+
+
+def _detect_batch(shm_name, shape, frame_numbers, video_name, extracted_dir, analysed_dir, image_extension):
+    """Exécuté dans un worker : lit un lot de frames en mémoire partagée et l'analyse en un appel du modèle."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf).copy()  # Les résultats YOLO gardent les images
+    finally:
+        shm.close()
+
+    results = _model(list(frames), verbose=False)
+    return [
+        analyse_frame(frame, result, frame_number, video_name, extracted_dir, analysed_dir, image_extension, _embedder)
+        for frame_number, frame, result in zip(frame_numbers, frames, results)
+    ]
+
+
+class DetectorPool:
+    """
+    Pool de processus pour l'analyse YOLO : chaque worker charge le modèle une fois, limite ses
+    threads torch à sa part des cœurs et reçoit les lots de frames via la mémoire partagée
+    (pas de sérialisation des images). Les résultats sont rendus dans l'ordre des lots.
+    """
+    def __init__(self, model_path, num_workers=None, torch_threads=None, embedder_name=EMBEDDER_NAME):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.num_workers)
+        # "spawn" : un fork d'un processus qui a déjà démarré torch peut se bloquer
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_path, embedder_name, torch_threads),
+        )
+        print(f"🧵 Pool de détection : {self.num_workers} processus, {torch_threads} thread(s) torch chacun.")
+
+    def submit(self, batch, video_name, extracted_dir, analysed_dir, image_extension):
+        """
+        Envoie un lot [(numéro, timestamp, frame), ...] (frames de même taille) à un worker.
+        Returns:
+            Future: [FrameDetections, ...] dans l'ordre du lot.
+        """
+        frames = np.stack([frame for _, _, frame in batch])
+        shm = shared_memory.SharedMemory(create=True, size=frames.nbytes)
+        np.ndarray(frames.shape, dtype=np.uint8, buffer=shm.buf)[:] = frames
+        future = self.executor.submit(
+            _detect_batch, shm.name, frames.shape, [frame_number for frame_number, _, _ in batch],
+            video_name, extracted_dir, analysed_dir, image_extension,
+        )
+        future.add_done_callback(lambda _: self._release(shm))
+        return future
+
+    @staticmethod
+    def _release(shm):
+        shm.close()
+        shm.unlink()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class FrameDetections:
+    """Détections d'une frame, retournées par le worker qui l'a analysée (aucune liste partagée)."""
+    def __init__(self, frame_number, image, class_ids, boxes, confidences, embeddings, class_names):
+        self.frame_number = frame_number
+        self.image = image  # Chemin de la frame extraite
+        self.class_ids = np.asarray(class_ids, dtype=np.int32)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)  # x, y (centre), largeur, hauteur
+        self.confidences = np.asarray(confidences, dtype=np.float32)
+        self.embeddings = embeddings  # np.ndarray (N, dimension), None si aucune détection
+        self.class_names = class_names  # {id de classe: nom}
+
+    def __len__(self):
+        return len(self.class_ids)
+
+
+class DetectionColumns:
+    """
+    Détections d'une vidéo en colonnes préallouées (une ligne par détection, dans l'ordre des frames) :
+    frame, timestamp, classe, boîte et confiance. La ligne i correspond à l'embedding i, donc à l'id i de l'index FAISS.
+    """
+    def __init__(self, size, dimension=0):
+        self.frame = np.empty(size, dtype=np.int32)
+        self.timestamp = np.zeros(size, dtype=np.float32)
+        self.class_id = np.empty(size, dtype=np.int32)
+        self.box = np.empty((size, 4), dtype=np.float32)
+        self.confidence = np.empty(size, dtype=np.float32)
+        self.embeddings = np.empty((size, dimension), dtype=np.float32)
+        self.class_names = {}  # id de classe -> nom
+
+    def __len__(self):
+        return len(self.frame)
+
+    @classmethod
+    def from_frames(cls, frames, timestamps=None):
+        """
+        Assemble les résultats par frame (dans l'ordre des frames) en un seul jeu de colonnes.
+        `timestamps` donne le timestamp (en secondes) de chaque numéro de frame.
+        """
+        frames = sorted(frames, key=lambda frame: frame.frame_number)
+        dimension = next((frame.embeddings.shape[1] for frame in frames if len(frame)), 0)
+        columns = cls(sum(len(frame) for frame in frames), dimension)
+        start = 0
+        for frame in frames:
+            columns.class_names.update(frame.class_names)
+            end = start + len(frame)
+            columns.frame[start:end] = frame.frame_number
+            columns.class_id[start:end] = frame.class_ids
+            columns.box[start:end] = frame.boxes
+            columns.confidence[start:end] = frame.confidences
+            if len(frame):
+                columns.embeddings[start:end] = frame.embeddings
+            start = end
+        if timestamps is not None:
+            columns.timestamp[:] = np.asarray(timestamps, dtype=np.float32)[columns.frame]
+        return columns
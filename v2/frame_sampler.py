@@ -0,0 +1,62 @@
+import cv2
+
+
+def sample_frames(video_path, target_timestamps):
+    """
+    Décode la vidéo une seule fois, en avançant, et retourne les frames aux timestamps demandés.
+    Les frames intermédiaires sont passées avec grab() (décodées mais pas converties en image),
+    au lieu d'ouvrir la vidéo et de revenir à la keyframe précédente pour chaque timestamp.
+
+    Args:
+        video_path (str): Chemin de la vidéo.
+        target_timestamps (list): Timestamps en secondes, croissants.
+    Yields:
+        tuple: (numéro de l'échantillon, timestamp, frame BGR). Un échantillon au-delà de la fin
+        de la vidéo (ou illisible) n'est pas retourné.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"❌ Impossible d'ouvrir la vidéo : {video_path}")
+        return
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    position = 0  # Index de la prochaine frame décodée
+    frame = None
+    try:
+        for frame_number, timestamp in enumerate(target_timestamps):
+            index = int(round(timestamp * fps))
+            if index < position:
+                # Même frame source que l'échantillon précédent (target_fps > fps de la vidéo)
+                if frame is not None:
+                    yield frame_number, timestamp, frame
+                continue
+            while position < index:
+                if not cap.grab():
+                    print(f"❌ Échec de l'extraction de la frame au timestamp {timestamp}s")
+                    return
+                position += 1
+            success, frame = cap.read()
+            if not success:
+                print(f"❌ Échec de l'extraction de la frame au timestamp {timestamp}s")
+                return
+            position += 1
+            yield frame_number, timestamp, frame
+    finally:
+        cap.release()
+
+
+def sample_batches(video_path, target_timestamps, batch_size):
+    """
+    Comme `sample_frames`, mais regroupe les échantillons par lots de `batch_size` frames
+    (le dernier lot peut être plus petit), pour une inférence par lot.
+    Yields:
+        list: [(numéro de l'échantillon, timestamp, frame BGR), ...].
+    """
+    batch = []
+    for sample in sample_frames(video_path, target_timestamps):
+        batch.append(sample)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
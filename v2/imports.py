@@ -4,7 +4,7 @@ import zipfile
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QTreeWidget, QTreeWidgetItem, QPushButton, QStackedWidget, 
     QSplitter, QTextEdit, QLabel, QComboBox, QHBoxLayout, QSizePolicy, QFileDialog, 
-    QTreeWidgetItem, QMessageBox, QSlider
+    QTreeWidgetItem, QMessageBox, QSlider, QCheckBox
 )
 from PyQt6.QtMultimedia import QMediaPlayer
 from PyQt6.QtMultimediaWidgets import QVideoWidget
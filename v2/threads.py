@@ -5,15 +5,20 @@ from Florence2_Analysis import Florence2Analysis
 from Clip_Analysis import ClipAnalysis
 import os
 
+def analysis_workers(use_processes):
+    """Nombre de workers YOLO : un processus par cœur en mode processus, sinon 4 threads."""
+    return (os.cpu_count() or 4) if use_processes else 4
+
 class Yolo11AnalysisThread(QThread):
     analysis_finished = pyqtSignal(str)
 
-    def __init__(self, video_path, model_name, target_folder, target_fps=15, parent=None):
+    def __init__(self, video_path, model_name, target_folder, target_fps=15, use_processes=False, parent=None):
         super().__init__(parent)
         self.video_path = video_path
         self.model_name = model_name
         self.target_folder = target_folder
         self.target_fps = target_fps
+        self.use_processes = use_processes  # Un processus de détection par cœur (voir DetectorPool)
 
     def run(self):
         """Exécute l'analyse dans un thread séparé."""
@@ -22,7 +27,8 @@ class Yolo11AnalysisThread(QThread):
         # Initialiser l'analyse
         analysis = Yolo11VideoAnalysis(self.target_folder)
         video_folder, video_name = analysis.extract_and_process_frames(
-            self.video_path, target_fps=self.target_fps, model_name=self.model_name, existing_folder=self.target_folder
+            self.video_path, target_fps=self.target_fps, model_name=self.model_name, existing_folder=self.target_folder,
+            num_threads=analysis_workers(self.use_processes), use_processes=self.use_processes
         )
         if video_folder:
             analysis.create_video_from_frames(
@@ -34,11 +40,12 @@ class Yolo11AnalysisThread(QThread):
 class Yolo8AnalysisThread(QThread):
     analysis_finished = pyqtSignal(str)
 
-    def __init__(self, analysis_folder, video_path, target_fps=15, parent=None):
+    def __init__(self, analysis_folder, video_path, target_fps=15, use_processes=False, parent=None):
         super().__init__(parent)
         self.analysis_folder = analysis_folder
         self.video_path = video_path
         self.target_fps = target_fps
+        self.use_processes = use_processes  # Un processus de détection par cœur (voir DetectorPool)
 
     def run(self):
             """Exécute l'analyse avec YOLOv8 dans un thread séparé."""
@@ -48,7 +55,10 @@ class Yolo8AnalysisThread(QThread):
                 analyzer = Yolo8VideoAnalysis(self.analysis_folder)
 
                 # Lancer l'analyse
-                result_folder = analyzer.extract_and_process_frames(self.video_path, self.target_fps, "Yolo8")
+                result_folder = analyzer.extract_and_process_frames(
+                    self.video_path, self.target_fps, "Yolo8",
+                    num_threads=analysis_workers(self.use_processes), use_processes=self.use_processes
+                )
                 if result_folder:
                     # Générer la vidéo annotée
                     analysed_dir = os.path.join(result_folder, "Analysed_Frames")
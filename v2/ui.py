@@ -111,6 +111,10 @@ class VideoAnalysisUI(QWidget):
         self.TimeLabel = QLabel("~ 00:00:00")
         self.TimeLabel.setWordWrap(True)
         ModelFilesLayout.addWidget(self.TimeLabel)
+        # Analyse YOLO par un processus par cœur (serveurs multi-cœurs) au lieu de threads
+        self.processesBox = QCheckBox("Multi-processus")
+        self.processesBox.setToolTip("YOLO : un processus de détection par cœur")
+        ModelFilesLayout.addWidget(self.processesBox)
         navLayout.addLayout(ModelFilesLayout)
         ## fonction get_fps + calculate_time_estimation + display_estimation
 
@@ -361,9 +365,13 @@ class VideoAnalysisUI(QWidget):
         elif model_name == "Florence-2":
             self.analysisThread = Florence2AnalysisThread(self.analysisFolder, self.videoPath, target_fps)
         elif model_name == "Yolo11":
-            self.analysisThread = Yolo11AnalysisThread(self.videoPath, model_name, target_folder, target_fps=target_fps)
+            self.analysisThread = Yolo11AnalysisThread(
+                self.videoPath, model_name, target_folder, target_fps=target_fps, use_processes=self.processesBox.isChecked()
+            )
         elif model_name == "Yolo8":
-            self.analysisThread = Yolo8AnalysisThread(self.analysisFolder, self.videoPath, target_fps)
+            self.analysisThread = Yolo8AnalysisThread(
+                self.analysisFolder, self.videoPath, target_fps, use_processes=self.processesBox.isChecked()
+            )
         else:
             print(f"❌ Modèle non pris en charge : {model_name}")
             self.loading_timer.stop()